@@ -0,0 +1,59 @@
+import re
+
+import pandas as pd
+
+# Numeric columns of the DEGIRO/flatex exports, parsed when the CSV is read
+ACCOUNT_NUMERIC_COLUMNS = ["Tipo", "Unnamed: 8", "Unnamed: 10"]
+PORTFOLIO_NUMERIC_COLUMNS = ["Cantidad", "Precio de cierre", "Valor en EUR"]
+
+# Everything that cannot be part of a number: currency codes and symbols, spaces
+NON_NUMERIC_PATTERN = r"[^\d,.+\-]"
+
+
+def parse_numbers(values, decimal=",", thousands="."):
+    """
+    Parses a column of exported amounts ("-1.234,56", "EUR 12,5", "1,0845") to
+    floats. Returns the numbers and a mask of the non-empty cells that could not
+    be parsed (which become NaN).
+
+    Currency codes, symbols and spaces are dropped, `thousands` separators are
+    removed where followed by a group of exactly three digits, and `decimal` is
+    the decimal separator. A `thousands` character followed by any other number
+    of digits ("1.0845") is read as a decimal point. Numeric columns are returned
+    as floats unchanged.
+    """
+    if pd.api.types.is_numeric_dtype(values) and not pd.api.types.is_bool_dtype(values):
+        return values.astype(float), pd.Series(False, index=values.index)
+
+    # Columns read in chunks can mix floats and strings: only parse the strings
+    if pd.api.types.infer_dtype(values, skipna=True).startswith("mixed"):
+        is_text = values.map(lambda value: isinstance(value, str)).astype(bool)
+        numbers = pd.to_numeric(values.where(~is_text), errors="coerce")
+        unparseable = pd.Series(False, index=values.index)
+        numbers[is_text], unparseable[is_text] = parse_numbers(
+            values[is_text].astype(str), decimal, thousands
+        )
+        return numbers.astype(float), unparseable
+
+    present = values.notna()
+    text = values.astype(str)
+
+    # Fast path: plain "-1234,56" cells only need their decimal separator swapped
+    plain = text.str.replace(decimal, ".", regex=False) if decimal != "." else text
+    numbers = pd.to_numeric(plain, errors="coerce").astype(float)
+    slow = present & (numbers.isna() | text.str.contains(thousands, regex=False))
+    if slow.any():
+        numbers[slow] = _parse_formatted(text[slow], decimal, thousands)
+
+    unparseable = present & numbers.isna()
+    unparseable[unparseable] = text[unparseable].str.strip().ne("")
+    return numbers, unparseable
+
+
+def _parse_formatted(text, decimal, thousands):
+    text = text.str.replace(NON_NUMERIC_PATTERN, "", regex=True)
+    grouping = re.escape(thousands) + r"(?=\d{3}(?!\d))"
+    text = text.str.replace(grouping, "", regex=True)
+    for separator in {decimal, thousands} - {"."}:
+        text = text.str.replace(separator, ".", regex=False)
+    return pd.to_numeric(text.where(text != "", None), errors="coerce")
@@ -0,0 +1,126 @@
+"""
+Benchmark of the SQLite connection overhead of an upload.
+
+Seeds a scratch database with synthetic market data and replays the lookups
+one /upload issues (schema check, symbols, latest dates, price panel, EUR/USD
+rates, profit/loss and the result cache version), first the old way, with the
+schema created and a fresh connection opened for every lookup, then through
+the long-lived connections of db.get_connection.
+
+    cd backend && python -m benchmarks.db_connections --uploads 200
+"""
+
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def upload_queries(products, start, end):
+    """
+    Returns the (query, parameters) pairs of one upload, in order.
+    """
+    names = [name.lower() for name in products]
+    tickers = [ticker for ticker, _ in products.values()]
+    symbols = ",".join("?" * len(tickers))
+    return [
+        ("SELECT MAX(rowid), MAX(Date) FROM stock_data", ()),
+        ("SELECT MAX(rowid), MAX(date) FROM exchange_rates", ()),
+        (
+            f"SELECT product, ticker FROM tickers WHERE product IN "
+            f"({','.join('?' * len(names))})",
+            names,
+        ),
+        (
+            f"SELECT Ticker, MAX(Date) FROM stock_data "
+            f"WHERE Ticker IN ({symbols}) GROUP BY Ticker",
+            tickers,
+        ),
+        ("SELECT MAX(date) FROM eur_usd_exchange", ()),
+        (
+            f"SELECT Date, Ticker, Close FROM stock_data "
+            f"WHERE Ticker IN ({symbols}) AND Date BETWEEN ? AND ?",
+            (*tickers, start, end),
+        ),
+        (
+            "SELECT date, exchange_rate FROM eur_usd_exchange "
+            "WHERE date BETWEEN ? AND ?",
+            (start, end),
+        ),
+        (
+            "SELECT fingerprint, MAX(date) FROM profit_loss "
+            "WHERE fingerprint IN (?, ?) GROUP BY fingerprint",
+            ("a", "b"),
+        ),
+        (
+            "SELECT date, SUM(profit_loss) FROM profit_loss "
+            "WHERE fingerprint IN (?, ?) GROUP BY date",
+            ("a", "b"),
+        ),
+        (
+            "SELECT key, value, expires_at FROM cache_entries WHERE namespace = ?",
+            ("symbols",),
+        ),
+        ("SELECT MAX(rowid), MAX(Date) FROM stock_data", ()),
+        ("SELECT MAX(rowid), MAX(date) FROM exchange_rates", ()),
+    ]
+
+
+def connect_per_query(db_path, queries):
+    from db import create_tables
+
+    create_tables(db_path)
+    for query, parameters in queries:
+        conn = sqlite3.connect(db_path)
+        conn.execute(query, parameters).fetchall()
+        conn.close()
+
+
+def shared_connection(db_path, queries):
+    from db import get_connection
+
+    for query, parameters in queries:
+        get_connection(db_path).execute(query, parameters).fetchall()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--uploads", type=int, default=200)
+    parser.add_argument("--products", type=int, default=20)
+    parser.add_argument("--years", type=int, default=10)
+    args = parser.parse_args()
+
+    sys.path.insert(0, BACKEND_DIR)
+    from benchmarks.synthetic import make_products, price_history, seed_database
+    from db import close_connections
+
+    end = datetime.now()
+    start = end - timedelta(days=365 * args.years)
+    products = make_products(args.products)
+    closes, fx = price_history(products, start, end)
+    queries = upload_queries(products, f"{start:%Y-%m-%d}", f"{end:%Y-%m-%d}")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "stocks.db")
+        seed_database(db_path, products, closes, fx)
+        print(f"{len(queries)} lookups per upload, {args.uploads} uploads")
+        for label, strategy in (
+            ("connect per query (before)", connect_per_query),
+            ("shared connection (after)", shared_connection),
+        ):
+            strategy(db_path, queries)  # warm up the page cache
+            started = time.perf_counter()
+            for _ in range(args.uploads):
+                strategy(db_path, queries)
+            per_upload = (time.perf_counter() - started) / args.uploads
+            print(f"{label:>27}: {per_upload * 1000:.2f} ms per upload")
+        close_connections()
+
+
+if __name__ == "__main__":
+    main()
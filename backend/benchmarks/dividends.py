@@ -0,0 +1,174 @@
+"""
+Benchmark of the dividend aggregation.
+
+Generates a synthetic account export with thousands of dividend payments and
+times the old per-group loop against the vectorized calculate_dividends, which
+must produce the same total.
+
+    cd backend && python -m benchmarks.dividends --trades 20000
+"""
+
+import argparse
+import io
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def calculate_dividends_grouped(account_df):
+    amount_column = "Unnamed: 8"  # Column containing amounts
+
+    total_dividends_received = 0
+
+    # Filter rows by 'Descripción' and 'ID Orden'
+    filtered_df = account_df[
+        account_df["Descripción"].isin(
+            [
+                "Ingreso Cambio de Divisa",
+                "Retirada Cambio de Divisa",
+                "Dividendo",
+                "Retención del dividendo",
+            ]
+        )
+        & account_df["ID Orden"].isna()
+    ]
+
+    # Filter for relevant descriptions: Dividendo, Retención del dividendo, Retirada Cambio de Divisa
+    relevant_descriptions = [
+        "Dividendo",
+        "Retención del dividendo",
+        "Retirada Cambio de Divisa",
+    ]
+    relevant_df = filtered_df[
+        filtered_df["Descripción"].isin(relevant_descriptions)
+    ].copy()
+
+    relevant_df_eur = relevant_df[relevant_df["Saldo"] == "EUR"]
+    relevant_df_eur = relevant_df_eur[~relevant_df_eur["Producto"].isna()]
+
+    relevant_df_usd = relevant_df[relevant_df["Saldo"] == "USD"].copy()
+    relevant_df_usd.loc[:, "Tipo"] = relevant_df_usd["Tipo"].ffill()
+
+    # Create a new DataFrame to store the calculated results
+    result_df = []
+
+    # Process EUR dividends
+    euro_groups = relevant_df_eur.groupby(["Fecha valor", "Producto"])
+    for group_id, group in euro_groups:
+        dividend_row = group[group["Descripción"] == "Dividendo"]
+        retention_row = group[group["Descripción"] == "Retención del dividendo"]
+
+        # Skip if the dividend row is empty
+        if dividend_row.empty:
+            continue
+
+        # Extract values for calculation
+        dividend_amount = (
+            float(dividend_row[amount_column].iloc[0]) if not dividend_row.empty else 0
+        )
+        retention_amount = (
+            abs(float(retention_row[amount_column].iloc[0]))
+            if not retention_row.empty
+            else 0
+        )
+
+        # Calculate the net dividend
+        net_dividend = dividend_amount - retention_amount
+
+        # Store the result
+        result_df.append(
+            {
+                "Product": dividend_row["Producto"].iloc[0],
+                "Gross Dividend": dividend_amount,
+                "Retention": retention_amount,
+                "Net Dividend": net_dividend,
+                "Currency": "EUR",
+            }
+        )
+
+    # Process USD dividends
+    usd_groups = relevant_df_usd.groupby(["Fecha valor", "Producto"])
+    for group_id, group in usd_groups:
+        dividend_row = group[group["Descripción"] == "Dividendo"]
+        retention_row = group[group["Descripción"] == "Retención del dividendo"]
+        conversion_row = group[group["Descripción"] == "Retirada Cambio de Divisa"]
+
+        # Skip if the dividend row is empty
+        if dividend_row.empty:
+            continue
+
+        # Extract values for calculation
+        dividend_amount = (
+            float(dividend_row[amount_column].iloc[0]) if not dividend_row.empty else 0
+        )
+        retention_amount = (
+            abs(float(retention_row[amount_column].iloc[0]))
+            if not retention_row.empty
+            else 0
+        )
+        conversion_rate = (
+            float(conversion_row["Tipo"].iloc[0]) if not conversion_row.empty else 1
+        )
+
+        # Calculate the net dividend and convert to EUR
+        net_dividend = (dividend_amount - retention_amount) * conversion_rate
+
+        # Store the result
+        result_df.append(
+            {
+                "Product": dividend_row["Producto"].iloc[0],
+                "Gross Dividend": dividend_amount,
+                "Retention": retention_amount,
+                "Net Dividend": net_dividend,
+                "Currency": "EUR",
+            }
+        )
+
+    # Convert the result to a DataFrame
+    result_df = pd.DataFrame(result_df)
+
+    # Calculate the total dividends in EUR
+    total_dividends_received = result_df["Net Dividend"].sum()
+    return total_dividends_received
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--trades", type=int, default=20_000)
+    parser.add_argument("--products", type=int, default=50)
+    parser.add_argument("--years", type=int, default=10)
+    args = parser.parse_args()
+
+    sys.path.insert(0, BACKEND_DIR)
+    from benchmarks.synthetic import generate_exports, make_products, price_history
+    from process_data import calculate_dividends, prepare_account_df
+
+    end = datetime.now()
+    products = make_products(args.products)
+    closes, fx = price_history(products, end - timedelta(days=365 * args.years), end)
+    account_csv, _ = generate_exports(products, closes, fx, args.trades)
+    account_df = pd.read_csv(io.BytesIO(account_csv))
+    prepare_account_df(account_df)
+    payments = (account_df["Descripción"] == "Dividendo").sum()
+    print(f"{len(account_df)} account rows, {payments} dividend payments")
+
+    started = time.perf_counter()
+    before_total = calculate_dividends_grouped(account_df)
+    before = time.perf_counter() - started
+
+    started = time.perf_counter()
+    after_total, _ = calculate_dividends(account_df)
+    after = time.perf_counter() - started
+
+    assert before_total == after_total, (before_total, after_total)
+    print(f"{'per-group loop (before)':>24}: {before:.3f}s")
+    print(f"{'vectorized (after)':>24}: {after:.3f}s ({before / after:.0f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""
+Benchmark of Yahoo ticker and price lookups against a local stub HTTP server.
+
+Compares a new aiohttp session per request (the old behaviour) with the shared,
+pooled client from http_client, resolving N products (search + chart request).
+
+    cd backend && python -m benchmarks.http_lookups --products 200
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+async def start_stub_server(latency):
+    from aiohttp import web
+
+    async def search(request):
+        await asyncio.sleep(latency)
+        symbol = request.query["q"].upper().replace(" ", "")[:8]
+        return web.json_response({"quotes": [{"symbol": symbol}]})
+
+    async def chart(request):
+        await asyncio.sleep(latency)
+        meta = {"regularMarketPrice": 100.0, "currency": "EUR"}
+        return web.json_response({"chart": {"result": [{"meta": meta}]}})
+
+    app = web.Application()
+    app.router.add_get("/v1/finance/search", search)
+    app.router.add_get("/v8/finance/chart/{ticker}", chart)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f"http://127.0.0.1:{port}"
+
+
+async def per_call_session_lookup(base_url, product):
+    import aiohttp
+
+    async with aiohttp.ClientSession() as session:
+        async with session.get(
+            f"{base_url}/v1/finance/search", params={"q": product}
+        ) as response:
+            ticker = (await response.json())["quotes"][0]["symbol"]
+    async with aiohttp.ClientSession() as session:
+        async with session.get(f"{base_url}/v8/finance/chart/{ticker}") as response:
+            data = await response.json()
+    return data["chart"]["result"][0]["meta"]["regularMarketPrice"]
+
+
+async def shared_client_lookup(base_url, product):
+    from http_client import fetch_json
+
+    data = await fetch_json(f"{base_url}/v1/finance/search", {"q": product})
+    ticker = data["quotes"][0]["symbol"]
+    data = await fetch_json(f"{base_url}/v8/finance/chart/{ticker}", {"interval": "1d"})
+    return data["chart"]["result"][0]["meta"]["regularMarketPrice"]
+
+
+async def run(products, concurrency, latency):
+    import http_client
+
+    runner, base_url = await start_stub_server(latency)
+    semaphore = asyncio.Semaphore(concurrency)
+    results = {}
+
+    async def bounded(lookup, product):
+        async with semaphore:
+            return await lookup(base_url, product)
+
+    try:
+        for label, lookup in (
+            ("session per call", per_call_session_lookup),
+            ("shared client", shared_client_lookup),
+        ):
+            started = time.perf_counter()
+            prices = await asyncio.gather(
+                *(bounded(lookup, f"product {i}") for i in range(products))
+            )
+            elapsed = time.perf_counter() - started
+            assert all(price is not None for price in prices)
+            results[label] = {
+                "lookups": products,
+                "concurrency": concurrency,
+                "seconds": round(elapsed, 3),
+                "lookups_per_sec": round(products / elapsed, 1),
+            }
+    finally:
+        await http_client.close_http_client()
+        await runner.cleanup()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--products", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.005)
+    args = parser.parse_args()
+
+    sys.path.insert(0, BACKEND_DIR)
+    results = asyncio.run(run(args.products, args.concurrency, args.latency))
+    for label, result in results.items():
+        print(f"{label:>16}: {result}")
+
+
+if __name__ == "__main__":
+    main()
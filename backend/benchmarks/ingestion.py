@@ -0,0 +1,112 @@
+"""
+Ingestion benchmark for large account exports.
+
+Writes a synthetic DEGIRO account export of about --size-mb megabytes (a block
+of generated rows repeated) and reads it in a fresh process per strategy: the
+old whole-file read with inferred dtypes and per-cell amount cleaning, and
+ingestion.read_account_csv. Each run reports rows/sec, the size of the
+resulting frame and the peak RSS.
+
+    cd backend && python -m benchmarks.ingestion --size-mb 1024
+"""
+
+import argparse
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def write_export(path, size_mb, trades_per_block=20_000):
+    from benchmarks.synthetic import generate_exports, make_products, price_history
+
+    end = datetime.now()
+    products = make_products(50)
+    closes, fx = price_history(products, end - timedelta(days=3650), end)
+    account_csv, _ = generate_exports(products, closes, fx, trades_per_block)
+    header, _, block = account_csv.partition(b"\n")
+
+    with open(path, "wb") as f:
+        f.write(header + b"\n")
+        while f.tell() < size_mb * 1024 * 1024:
+            f.write(block)
+
+
+def read_whole_file(path):
+    import pandas as pd
+
+    with open(path, "rb") as f:
+        data = f.read()
+    df = pd.read_csv(io.BytesIO(data))
+    # The old pipeline then cleaned the amounts cell by cell
+    df["Unnamed: 8"] = df["Unnamed: 8"].apply(
+        lambda value: float(value.replace(",", "")) if isinstance(value, str) else value
+    )
+    return df
+
+
+def read_streaming(path):
+    from ingestion import read_account_csv
+
+    with open(path, "rb") as f:
+        df, _, _ = read_account_csv(f)
+    return df
+
+
+def run_strategy(strategy, path):
+    """Runs in a child process, so peak RSS only covers this strategy."""
+    from ingestion import peak_rss_bytes
+
+    started = time.perf_counter()
+    df = {"whole file": read_whole_file, "streaming": read_streaming}[strategy](path)
+    seconds = time.perf_counter() - started
+    print(
+        json.dumps(
+            {
+                "rows": len(df),
+                "seconds": round(seconds, 2),
+                "rows_per_sec": round(len(df) / seconds),
+                "frame_mib": int(df.memory_usage(deep=True).sum()) >> 20,
+                "peak_rss_mib": peak_rss_bytes() >> 20,
+            }
+        )
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--size-mb", type=int, default=1024)
+    parser.add_argument("--run", nargs=2, metavar=("STRATEGY", "PATH"))
+    args = parser.parse_args()
+
+    sys.path.insert(0, BACKEND_DIR)
+    if args.run:
+        run_strategy(*args.run)
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "Account.csv")
+        write_export(path, args.size_mb)
+        print(f"export: {os.path.getsize(path) >> 20} MiB")
+        for strategy in ("whole file", "streaming"):
+            child = subprocess.run(
+                [sys.executable, "-m", "benchmarks.ingestion", "--run", strategy, path],
+                cwd=BACKEND_DIR,
+                capture_output=True,
+                text=True,
+            )
+            if child.returncode:
+                result = f"failed with exit code {child.returncode}"
+            else:
+                result = child.stdout.strip().splitlines()[-1]
+            print(f"{strategy:>12}: {result}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+"""
+Benchmark of the lot matching engine.
+
+Generates a random sequence of buys and sells over a set of products and times
+the old list-of-dicts matching (every sale rescans the lots from the first one)
+against lots.LotBook in each of its modes.
+
+    cd backend && python -m benchmarks.lot_matching --trades 100000 --products 20
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def make_trades(n_trades, n_products, sell_ratio=0.2, max_sell=5, seed=0):
+    """
+    Returns (product, side, quantity, price, date) tuples, never selling more
+    than is held.
+    """
+    rnd = random.Random(seed)
+    held = [0] * n_products
+    date = datetime(2000, 1, 3)
+    trades = []
+    for _ in range(n_trades):
+        date += timedelta(days=rnd.random() < 0.2)
+        product = rnd.randrange(n_products)
+        if held[product] and rnd.random() < sell_ratio:
+            quantity = rnd.randint(1, min(held[product], max_sell))
+            held[product] -= quantity
+            trades.append((product, "sell", quantity, None, date))
+        else:
+            quantity = rnd.randint(1, 20)
+            held[product] += quantity
+            trades.append((product, "buy", quantity, rnd.uniform(10, 500), date))
+    return trades
+
+
+def match_list_of_dicts(trades):
+    positions = {}
+    for product, side, quantity, price, date in trades:
+        if side == "buy":
+            positions.setdefault(product, []).append(
+                {
+                    "currency": "EUR",
+                    "quantity": quantity,
+                    "cost_per_unit": price,
+                    "start_date": date,
+                    "end_date": None,
+                }
+            )
+        elif product in positions:
+            lot_num = 0
+            remaining_quantity = quantity
+            while remaining_quantity > 0:
+                lot = positions[product][lot_num]
+                if lot["quantity"] <= remaining_quantity:
+                    remaining_quantity -= lot["quantity"]
+                    lot["end_date"] = date
+                else:
+                    lot["quantity"] -= remaining_quantity
+                    lot["end_date"] = date
+                    remaining_quantity = 0
+                lot_num += 1
+    return positions
+
+
+def match_list_pop_front(trades):
+    positions = {}
+    closed = []
+    for product, side, quantity, price, date in trades:
+        if side == "buy":
+            positions.setdefault(product, []).append([quantity, price, date])
+        elif product in positions:
+            lots = positions[product]
+            while quantity > 0 and lots:
+                lot = lots[0]
+                sold = min(lot[0], quantity)
+                closed.append((product, sold, lot[1], lot[2], date))
+                quantity -= sold
+                lot[0] -= sold
+                if not lot[0]:
+                    lots.pop(0)
+    return positions
+
+
+def match_lot_books(trades, method):
+    from lots import LotBook
+
+    books = {}
+    for product, side, quantity, price, date in trades:
+        if side == "buy":
+            if product not in books:
+                books[product] = LotBook("EUR", method)
+            books[product].buy(quantity, price, date)
+        elif product in books:
+            books[product].sell(quantity, date)
+    return {product: book.lots() for product, book in books.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--trades", type=int, default=100_000)
+    parser.add_argument("--products", type=int, default=20)
+    parser.add_argument("--sell-ratio", type=float, default=0.2)
+    parser.add_argument("--max-sell", type=int, default=5)
+    args = parser.parse_args()
+
+    sys.path.insert(0, BACKEND_DIR)
+    trades = make_trades(args.trades, args.products, args.sell_ratio, args.max_sell)
+    runs = [
+        ("list of dicts (before)", match_list_of_dicts),
+        ("list with pop(0)", match_list_pop_front),
+    ] + [
+        (
+            f"LotBook {method}",
+            lambda trades, method=method: match_lot_books(trades, method),
+        )
+        for method in ("fifo", "lifo", "average")
+    ]
+    for label, match in runs:
+        started = time.perf_counter()
+        positions = match(trades)
+        elapsed = time.perf_counter() - started
+        n_lots = sum(len(lots) for lots in positions.values())
+        print(f"{label:>24}: {elapsed:.3f}s, {n_lots} lots")
+
+
+if __name__ == "__main__":
+    main()
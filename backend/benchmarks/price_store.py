@@ -0,0 +1,83 @@
+"""
+Benchmark of full-history price reads.
+
+Seeds a scratch database with random-walk closes for --tickers tickers,
+copies them into a columnar price store and times load_price_panel over the
+whole history, reading from the stock_data table and from the memory-mapped
+store. Both must return the same panel.
+
+    cd backend && python -m benchmarks.price_store --tickers 500 --years 10
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def best_time(func, repeats):
+    timings = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        result = func()
+        timings.append(time.perf_counter() - started)
+    return min(timings), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--tickers", type=int, default=500)
+    parser.add_argument("--years", type=int, default=10)
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    sys.path.insert(0, BACKEND_DIR)
+    import stock_service
+    from benchmarks.synthetic import make_products, price_history, seed_database
+    from db import close_connections, get_connection
+    from price_store import PriceStore
+
+    end = datetime.now()
+    start = end - timedelta(days=365 * args.years)
+    products = make_products(args.tickers)
+    closes, fx = price_history(products, start, end)
+    ticker_ranges = {
+        ticker: (f"{start:%Y-%m-%d}", f"{end:%Y-%m-%d}")
+        for ticker, _ in products.values()
+    }
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "stocks.db")
+        seed_database(db_path, products, closes, fx)
+        store = PriceStore(os.path.join(tmp, "prices"))
+        started = time.perf_counter()
+        added = store.sync(get_connection(db_path), list(ticker_ranges))
+        print(
+            f"{args.tickers} tickers, {added} closes, "
+            f"store built in {time.perf_counter() - started:.2f}s"
+        )
+
+        results = {}
+        for label, source in (("sqlite", None), ("price store", store)):
+            stock_service.get_price_store = lambda: source
+            seconds, panel = best_time(
+                lambda: stock_service.load_price_panel(ticker_ranges, db_path),
+                args.repeats,
+            )
+            results[label] = panel
+            print(f"{label:>12}: {seconds * 1000:.1f} ms per full-history panel")
+        close_connections()
+
+    sqlite_panel, store_panel = results["sqlite"], results["price store"]
+    assert np.array_equal(sqlite_panel.dates, store_panel.dates)
+    assert np.array_equal(sqlite_panel.closes, store_panel.closes, equal_nan=True)
+
+
+if __name__ == "__main__":
+    main()
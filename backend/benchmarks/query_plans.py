@@ -0,0 +1,107 @@
+"""
+Checks that the hot queries are served by the lookup indexes.
+
+Creates a scratch database with db.create_tables, runs EXPLAIN QUERY PLAN on
+each query the services issue per upload and fails (exit code 1) when a plan
+scans a table or uses another index than expected.
+
+    cd backend && python -m benchmarks.query_plans
+"""
+
+import os
+import sys
+import tempfile
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# (name, query, parameters, index every table access must use)
+HOT_QUERIES = [
+    (
+        "price panel",
+        """
+        SELECT Date, Ticker, Close FROM stock_data
+        WHERE Ticker IN (?, ?, ?) AND Date BETWEEN ? AND ?
+        """,
+        ("AAA", "BBB", "CCC", "2020-01-01", "2024-01-01"),
+        "COVERING INDEX idx_stock_data_ticker_date",
+    ),
+    (
+        "latest price dates",
+        """
+        SELECT Ticker, MAX(Date) FROM stock_data
+        WHERE Ticker IN (?, ?, ?) GROUP BY Ticker
+        """,
+        ("AAA", "BBB", "CCC"),
+        "COVERING INDEX idx_stock_data_ticker_date",
+    ),
+    (
+        "exchange rates",
+        "SELECT date, exchange_rate FROM eur_usd_exchange WHERE date BETWEEN ? AND ?",
+        ("2020-01-01", "2024-01-01"),
+        "COVERING INDEX idx_exchange_rates_pair_date_rate",
+    ),
+    (
+        "daily profit/loss",
+        """
+        SELECT date, SUM(profit_loss) FROM profit_loss
+        WHERE fingerprint IN (?, ?) GROUP BY date
+        """,
+        ("a", "b"),
+        "COVERING INDEX idx_profit_loss_fingerprint_date",
+    ),
+    (
+        "latest profit/loss dates",
+        """
+        SELECT fingerprint, MAX(date) FROM profit_loss
+        WHERE fingerprint IN (?, ?) GROUP BY fingerprint
+        """,
+        ("a", "b"),
+        "COVERING INDEX idx_profit_loss_fingerprint_date_key",
+    ),
+    (
+        "tickers by product",
+        "SELECT product, ticker FROM tickers WHERE product IN (?, ?)",
+        ("Apple", "Microsoft"),
+        "INDEX idx_tickers_product",
+    ),
+]
+
+
+def check_plans(conn):
+    """
+    Returns a list of (name, plan) for the HOT_QUERIES not using their index.
+    """
+    failures = []
+    for name, query, parameters, index in HOT_QUERIES:
+        rows = conn.execute(f"EXPLAIN QUERY PLAN {query}", parameters).fetchall()
+        accesses = [row[3] for row in rows if row[3].startswith(("SCAN", "SEARCH"))]
+        # Temp B-trees for GROUP BY/ORDER BY are fine, table scans are not
+        accesses = [detail for detail in accesses if "B-TREE" not in detail]
+        plan = "; ".join(row[3] for row in rows)
+        if not accesses or not all(
+            detail.startswith("SEARCH") and f"USING {index} " in f"{detail} "
+            for detail in accesses
+        ):
+            failures.append((name, plan))
+        print(f"{name:>24}: {plan}")
+    return failures
+
+
+def main():
+    sys.path.insert(0, BACKEND_DIR)
+    from db import connect, create_tables
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "stocks.db")
+        create_tables(path)
+        conn = connect(path)
+        failures = check_plans(conn)
+        conn.close()
+
+    for name, plan in failures:
+        print(f"FAIL {name}: {plan}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
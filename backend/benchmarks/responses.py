@@ -0,0 +1,82 @@
+"""
+Benchmark of the /upload response encoding.
+
+Builds the time series of a --years daily history and encodes the metrics
+in both layouts, with the standard library encoder JSONResponse used before
+and with responses.encode_json (which must decode to the same metrics), then
+compresses the encoded body with each available content coding. Reports the
+time and the bytes of each step.
+
+    cd backend && python -m benchmarks.responses --years 15
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def best_time(func, repeats):
+    timings = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        result = func()
+        timings.append(time.perf_counter() - started)
+    return min(timings), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--years", type=int, default=15)
+    parser.add_argument("--deposits", type=int, default=500)
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+
+    sys.path.insert(0, BACKEND_DIR)
+    from fastapi.responses import JSONResponse
+
+    import responses
+    from benchmarks.time_series import make_inputs
+    from process_data import build_time_series, time_series_columns, time_series_records
+
+    account_df, portfolio_value = make_inputs(args.years, args.deposits)
+    series = build_time_series(account_df, portfolio_value)
+    keys = ("historical_portfolio_value", "historical_cashflow", "combined_data")
+    layouts = {
+        "records": dict(zip(keys, time_series_records(series))),
+        "columnar": {"time_series": time_series_columns(series)},
+    }
+    print(f"{len(series)} days, orjson: {responses.orjson is not None}")
+
+    for layout, metrics in layouts.items():
+        encoders = [("encode_json", lambda: responses.encode_json(metrics))]
+        if layout == "records":
+            # JSONResponse cannot encode the NumPy arrays of the columnar layout
+            encoders.insert(
+                0, ("JSONResponse (before)", lambda: JSONResponse(metrics).body)
+            )
+        bodies = []
+        for label, encode in encoders:
+            seconds, body = best_time(encode, args.repeats)
+            bodies.append(json.loads(body))
+            print(
+                f"{layout:>8} {label:>21}: {seconds * 1000:6.1f} ms, "
+                f"{len(body) / 1024:7.1f} KiB"
+            )
+        assert all(decoded == bodies[0] for decoded in bodies)
+
+        for encoding in responses.CONTENT_ENCODINGS:
+            seconds, compressed = best_time(
+                lambda: responses.compress(body, encoding), args.repeats
+            )
+            print(
+                f"{layout:>8} {encoding:>21}: {seconds * 1000:6.1f} ms, "
+                f"{len(compressed) / 1024:7.1f} KiB"
+            )
+
+
+if __name__ == "__main__":
+    main()
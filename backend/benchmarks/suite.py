@@ -0,0 +1,326 @@
+"""
+Offline benchmark suite writing its timings as JSON, to compare across commits.
+
+Generates DEGIRO-style exports and market data at the given scale in a scratch
+directory, serves the Yahoo search/chart endpoints from a local stub and feeds
+update_stock_data_table from the synthetic history, so nothing reaches the
+network. Times update_stock_data_table, calculate_total_daily_profit_loss,
+calculate_metrics_async and /upload end to end (served by uvicorn).
+
+    cd backend && python -m benchmarks.suite --trades 2000 --output after.json \\
+        --baseline before.json
+"""
+
+import argparse
+import asyncio
+import contextlib
+import functools
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# The pipeline only converts USD amounts to EUR
+CURRENCIES = ("EUR", "USD")
+
+
+def summarize(timings, **extra):
+    return {
+        "runs": len(timings),
+        "best_ms": round(min(timings) * 1000, 2),
+        "median_ms": round(statistics.median(timings) * 1000, 2),
+        **extra,
+    }
+
+
+def time_calls(func, repeats, setup=None):
+    """
+    Calls `func(*setup())` `repeats` times, timing the calls only.
+    """
+    timings = []
+    for _ in range(repeats):
+        args = setup() if setup else ()
+        started = time.perf_counter()
+        func(*args)
+        timings.append(time.perf_counter() - started)
+    return timings
+
+
+async def time_awaits(func, repeats, setup=None):
+    timings = []
+    for _ in range(repeats):
+        args = setup() if setup else ()
+        started = time.perf_counter()
+        await func(*args)
+        timings.append(time.perf_counter() - started)
+    return timings
+
+
+def bench_market_data(symbols, fetcher, repeats):
+    """
+    update_stock_data_table backfilling all symbols into an empty table, and
+    fetching the last week of each. The incremental update only fetches on
+    weekdays, its "rows" show whether it ran.
+    """
+    from db import get_connection, init_db
+    from stock_service import update_stock_data_table
+
+    db_path = "market_data.db"
+    init_db(db_path)
+    conn = get_connection(db_path)
+    cutoff = (datetime.now() - timedelta(days=7)).strftime("%Y-%m-%d")
+
+    def delete(where=""):
+        with conn:
+            conn.execute(f"DELETE FROM stock_data {where}", (cutoff,) if where else ())
+        return symbols, db_path, fetcher
+
+    def rows():
+        return conn.execute("SELECT COUNT(*) FROM stock_data").fetchone()[0]
+
+    results = {}
+    timings = time_calls(update_stock_data_table, repeats, delete)
+    results["update_stock_data_table.backfill"] = summarize(timings, rows=rows())
+    timings = time_calls(
+        update_stock_data_table, repeats, lambda: delete("WHERE Date > ?")
+    )
+    added = (
+        rows()
+        - conn.execute(
+            "SELECT COUNT(*) FROM stock_data WHERE Date <= ?", (cutoff,)
+        ).fetchone()[0]
+    )
+    results["update_stock_data_table.incremental"] = summarize(timings, rows=added)
+    return results
+
+
+async def bench_uploads(url, account_csv, portfolio_csv, repeats):
+    """
+    /upload requests: the first one (ticker search, profit/loss materialization),
+    then recalculations with the result cache emptied, then result cache hits.
+    """
+    import aiohttp
+
+    from result_cache import upload_results
+
+    stages = {}
+
+    async def upload(session):
+        data = aiohttp.FormData()
+        data.add_field("account", account_csv, filename="Account.csv")
+        data.add_field("portfolio", portfolio_csv, filename="Portfolio.csv")
+        async with session.post(url, data=data) as response:
+            await response.read()
+            response.raise_for_status()
+        stages.clear()
+        for stage in response.headers.get("Server-Timing", "").split(","):
+            name, _, duration = stage.strip().partition(";dur=")
+            if duration:
+                stages[name] = float(duration)
+
+    results = {}
+    timeout = aiohttp.ClientTimeout(total=None)
+    async with aiohttp.ClientSession(timeout=timeout) as session:
+        timings = await time_awaits(upload, 1, lambda: (session,))
+        results["upload.first"] = summarize(timings, stages_ms=dict(stages))
+
+        def recalculate():
+            upload_results.clear()
+            return (session,)
+
+        timings = await time_awaits(upload, repeats, recalculate)
+        results["upload.recalculate"] = summarize(timings, stages_ms=dict(stages))
+        timings = await time_awaits(upload, repeats, lambda: (session,))
+        results["upload.cached"] = summarize(timings)
+    return results
+
+
+async def bench_pipeline(account_csv, portfolio_csv, repeats):
+    """
+    calculate_metrics_async and calculate_total_daily_profit_loss called
+    directly, on exports parsed outside the timings.
+    """
+    from db import DB_PATH, get_connection
+    from ingestion import read_account_csv, read_portfolio_csv
+    from process_data import build_positions, calculate_metrics_async
+    from process_data import prepare_account_df
+    from stock_service import calculate_total_daily_profit_loss
+    from ticker_service import resolve_tickers
+
+    def exports():
+        return (
+            read_account_csv(account_csv)[0],
+            read_portfolio_csv(portfolio_csv)[0],
+        )
+
+    results = {}
+    timings = await time_awaits(calculate_metrics_async, repeats, exports)
+    results["calculate_metrics_async"] = summarize(timings)
+
+    account_df, _ = exports()
+    prepare_account_df(account_df)
+    positions = build_positions(account_df)
+    products_to_fetch = await resolve_tickers(positions.keys())
+    conn = get_connection(DB_PATH)
+
+    def rebuild():
+        with conn:
+            conn.execute("DELETE FROM profit_loss")
+        return positions, products_to_fetch
+
+    for name, setup, materialize in (
+        ("materialized", None, True),
+        ("rebuild", rebuild, True),
+        ("unmaterialized", None, False),
+    ):
+        timings = time_calls(
+            functools.partial(
+                calculate_total_daily_profit_loss, materialize=materialize
+            ),
+            repeats,
+            setup or (lambda: (positions, products_to_fetch)),
+        )
+        results[f"calculate_total_daily_profit_loss.{name}"] = summarize(timings)
+    return results
+
+
+async def run_online(app, base_url, account_csv, portfolio_csv, repeats):
+    import http_client
+    import ticker_service
+    from benchmarks.upload_load import free_port, start_server
+
+    ticker_service.YAHOO_BASE_URL = base_url
+    port = free_port()
+    server, thread = start_server(app, port)
+    try:
+        results = await bench_uploads(
+            f"http://127.0.0.1:{port}/upload", account_csv, portfolio_csv, repeats
+        )
+    finally:
+        server.should_exit = True
+        await asyncio.to_thread(thread.join)
+
+    await http_client.start_http_client()
+    try:
+        results.update(await bench_pipeline(account_csv, portfolio_csv, repeats))
+    finally:
+        await http_client.close_http_client()
+    return results
+
+
+async def run(args, products, closes, account_csv, portfolio_csv):
+    from benchmarks.synthetic import start_yahoo_stub
+    from main import app
+
+    runner, base_url = await start_yahoo_stub(products, closes, args.latency)
+    try:
+        return await run_online(app, base_url, account_csv, portfolio_csv, args.repeat)
+    finally:
+        await runner.cleanup()
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=BACKEND_DIR,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline):
+    """
+    Prints the best time of each benchmark against the `baseline` results.
+    """
+    print(f"{'benchmark':>50} {'baseline':>10} {'current':>10} {'ratio':>7}")
+    for name, result in results.items():
+        before = baseline.get(name)
+        if before is None:
+            continue
+        ratio = result["best_ms"] / before["best_ms"] if before["best_ms"] else 0
+        print(
+            f"{name:>50} {before['best_ms']:>10.1f} {result['best_ms']:>10.1f}"
+            f" {ratio:>6.2f}x"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--trades", type=int, default=500)
+    parser.add_argument("--products", type=int, default=20)
+    parser.add_argument("--years", type=int, default=10)
+    parser.add_argument("--currencies", default="USD,EUR")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--latency", type=float, default=0.005)
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--baseline", help="results JSON of an earlier run")
+    args = parser.parse_args()
+
+    currencies = tuple(args.currencies.split(","))
+    if not currencies or not set(currencies) <= set(CURRENCIES):
+        parser.error(f"--currencies must be a list of {', '.join(CURRENCIES)}")
+    output = os.path.abspath(args.output) if args.output else None
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["results"]
+
+    # The services use relative database and cache paths, so work in a scratch dir
+    sys.path.insert(0, BACKEND_DIR)
+    os.chdir(tempfile.mkdtemp(prefix="benchmark_suite_"))
+
+    from benchmarks.synthetic import generate_exports, history_fetcher
+    from benchmarks.synthetic import make_products, price_history, seed_database
+    from db import DB_PATH
+
+    end = datetime.now()
+    products = make_products(args.products, currencies)
+    closes, fx = price_history(
+        products, end - timedelta(days=365 * args.years), end, args.seed
+    )
+    # Tickers are left to the stubbed search
+    seed_database(DB_PATH, products, closes, fx, tickers=False)
+    account_csv, portfolio_csv = generate_exports(
+        products, closes, fx, args.trades, args.seed
+    )
+
+    # The services report progress with print, keep it out of the results
+    with contextlib.redirect_stdout(io.StringIO()):
+        results = bench_market_data(
+            list(closes.columns), history_fetcher(closes, fx, args.seed), args.repeat
+        )
+        results.update(
+            asyncio.run(run(args, products, closes, account_csv, portfolio_csv))
+        )
+
+    report = {
+        "commit": git_commit(),
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "parameters": vars(args),
+        "results": results,
+    }
+    if output:
+        with open(output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+    if baseline is not None:
+        compare(results, baseline)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,357 @@
+import asyncio
+import csv
+import io
+import random
+import sqlite3
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+ACCOUNT_HEADER = [
+    "Fecha",
+    "Hora",
+    "Fecha valor",
+    "Producto",
+    "ISIN",
+    "Descripción",
+    "Tipo",
+    "Variación",
+    "",
+    "Saldo",
+    "",
+    "ID Orden",
+]
+PORTFOLIO_HEADER = [
+    "Producto",
+    "Símbolo/ISIN",
+    "Cantidad",
+    "Precio de cierre",
+    "Valor local",
+    "Valor en EUR",
+]
+
+
+def format_amount(value):
+    """Formats a number the way DEGIRO exports it ("1234,56")."""
+    return f"{value:.2f}".replace(".", ",")
+
+
+def format_rate(value):
+    """Formats an exchange rate the way DEGIRO exports it ("1,0845")."""
+    return f"{value:.4f}".replace(".", ",")
+
+
+def make_products(n_products, currencies=("USD", "EUR")):
+    """
+    Returns {product name: (ticker, currency)} for synthetic products.
+    """
+    return {
+        f"Synthetic Holding {i:03d}": (f"SYN{i:03d}", currencies[i % len(currencies)])
+        for i in range(n_products)
+    }
+
+
+def price_history(products, start, end, seed=0):
+    """
+    Business-day random-walk closes as a DataFrame (dates x tickers) and an
+    EUR/USD rate Series on the same dates.
+    """
+    rng = np.random.default_rng(seed)
+    dates = pd.bdate_range(start, end)
+    tickers = [ticker for ticker, _ in products.values()]
+    returns = rng.normal(0.0003, 0.015, size=(len(dates), len(tickers)))
+    closes = rng.uniform(20, 300, size=len(tickers)) * np.exp(returns.cumsum(axis=0))
+    fx = 1.1 * np.exp(rng.normal(0, 0.003, size=len(dates)).cumsum())
+    return (
+        pd.DataFrame(closes, index=dates, columns=tickers),
+        pd.Series(fx, index=dates),
+    )
+
+
+def generate_exports(products, closes, fx, n_trades, seed=0):
+    """
+    Builds DEGIRO-style Account.csv and Portfolio.csv contents (newest row
+    first) from buys, sells, deposits, fees and dividends on the given prices.
+    """
+    rnd = random.Random(seed)
+    dates = closes.index
+    names = list(products)
+    held = {name: 0 for name in names}
+    events = []  # (date, sort key, row)
+
+    def row(date, product, description, rate, currency, amount, order_id=""):
+        day = date.strftime("%d-%m-%Y")
+        return [
+            day,
+            "09:00",
+            day,
+            product,
+            "",
+            description,
+            rate,
+            currency,
+            format_amount(amount),
+            currency,
+            "0,00",
+            order_id,
+        ]
+
+    for i, day_index in enumerate(
+        sorted(rnd.randrange(len(dates)) for _ in range(n_trades))
+    ):
+        date = dates[day_index]
+        name = rnd.choice(names)
+        ticker, currency = products[name]
+        price = round(float(closes.iloc[day_index][ticker]), 2)
+        rate = float(fx.iloc[day_index])
+        order_id = f"order-{i:08d}"
+        selling = held[name] > 0 and rnd.random() < 0.3
+        quantity = rnd.randint(1, held[name]) if selling else rnd.randint(1, 20)
+        side = "Venta" if selling else "Compra"
+        held[name] += -quantity if selling else quantity
+        total = price * quantity * (1 if selling else -1)
+        price_text = f"{price}".replace(".", ",")
+
+        rows = [
+            row(
+                date,
+                name,
+                f"{side} {quantity} {name}@{price_text} {currency}",
+                "",
+                currency,
+                total,
+                order_id,
+            ),
+            row(
+                date,
+                name,
+                "Costes de transacción y/o externos de DEGIRO",
+                "",
+                "EUR",
+                -2.0,
+                order_id,
+            ),
+        ]
+        if currency == "USD":
+            rows += [
+                row(
+                    date,
+                    "",
+                    "Ingreso Cambio de Divisa",
+                    format_rate(rate),
+                    "USD",
+                    -total,
+                    order_id,
+                ),
+                row(
+                    date,
+                    "",
+                    "Retirada Cambio de Divisa",
+                    "",
+                    "EUR",
+                    total / rate,
+                    order_id,
+                ),
+            ]
+        if not selling:
+            deposit = -total / rate if currency == "USD" else -total
+            rows.append(row(date, "", "flatex Deposit", "", "EUR", deposit + 2))
+        events.extend((date, i, position, r) for position, r in enumerate(rows))
+
+        # Quarterly dividend on the position some time later
+        if held[name] and rnd.random() < 0.3 and day_index + 60 < len(dates):
+            paid = dates[day_index + 60]
+            gross = round(held[name] * price * 0.005, 2)
+            dividend_rows = [
+                row(paid, name, "Dividendo", "", currency, gross),
+                row(paid, name, "Retención del dividendo", "", currency, -gross * 0.15),
+            ]
+            if currency == "USD":
+                dividend_rows.append(
+                    row(
+                        paid,
+                        "",
+                        "Retirada Cambio de Divisa",
+                        format_rate(rate),
+                        "USD",
+                        -gross * 0.85,
+                    )
+                )
+            events.extend(
+                (paid, i, 10 + position, r) for position, r in enumerate(dividend_rows)
+            )
+
+    for year in range(dates[0].year, dates[-1].year + 1):
+        fee_date = max(dates[0], min(dates[-1], pd.Timestamp(year, 12, 31)))
+        events.append(
+            (
+                fee_date,
+                -1,
+                0,
+                row(
+                    fee_date,
+                    "",
+                    f"Comisión de conectividad con el mercado {year}",
+                    "",
+                    "EUR",
+                    -2.5,
+                ),
+            )
+        )
+
+    # Newest first, keeping the rows of one operation together in export order
+    events.sort(key=lambda event: event[:3], reverse=True)
+    account = io.StringIO()
+    writer = csv.writer(account)
+    writer.writerow(ACCOUNT_HEADER)
+    writer.writerows(event[3] for event in events)
+
+    portfolio = io.StringIO()
+    writer = csv.writer(portfolio)
+    writer.writerow(PORTFOLIO_HEADER)
+    writer.writerow(
+        ["CASH & CASH FUND & FTX CASH (EUR)", "", "", "", "EUR 1000,00", "1000,00"]
+    )
+    for name, quantity in held.items():
+        if quantity:
+            ticker, currency = products[name]
+            price = float(closes.iloc[-1][ticker])
+            value = price * quantity / (float(fx.iloc[-1]) if currency == "USD" else 1)
+            writer.writerow(
+                [
+                    name,
+                    ticker,
+                    quantity,
+                    format_amount(price),
+                    f"{currency} {format_amount(price * quantity)}",
+                    format_amount(value),
+                ]
+            )
+
+    return account.getvalue().encode(), portfolio.getvalue().encode()
+
+
+def seed_database(db_path, products, closes, fx, tickers=True):
+    """
+    Stores the synthetic closes and EUR/USD rates, and with `tickers` the
+    product tickers, so uploads of the generated exports never reach the
+    network. Without them the tickers are searched (see start_yahoo_stub).
+    """
+    from db import create_tables
+
+    create_tables(db_path)
+    now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    conn = sqlite3.connect(db_path)
+    if tickers:
+        conn.executemany(
+            "INSERT INTO tickers (product, ticker, date_added) VALUES (?, ?, ?)",
+            [(name.lower(), ticker, now) for name, (ticker, _) in products.items()],
+        )
+    stacked = closes.stack()
+    conn.executemany(
+        """
+        INSERT OR REPLACE INTO stock_data
+        (Date, Ticker, Open, High, Low, Close, Volume, Dividends, Stock_Splits)
+        VALUES (?, ?, ?, ?, ?, ?, 0, 0, 0)
+    """,
+        (
+            (date.strftime("%Y-%m-%d"), ticker, close, close, close, close)
+            for (date, ticker), close in stacked.items()
+        ),
+    )
+    conn.executemany(
+        """
+        INSERT OR REPLACE INTO exchange_rates (pair, date, rate, date_added)
+        VALUES ('EURUSD', ?, ?, ?)
+    """,
+        ((date.strftime("%Y-%m-%d"), rate, now) for date, rate in fx.items()),
+    )
+    conn.commit()
+    conn.close()
+
+
+def build_dataset(db_path, n_trades=500, n_products=20, years=10, seed=0):
+    """
+    Seeds `db_path` with market data up to today and returns matching
+    (account_csv, portfolio_csv) bytes.
+    """
+    end = datetime.now()
+    start = end - timedelta(days=365 * years)
+    products = make_products(n_products)
+    closes, fx = price_history(products, start, end, seed)
+    seed_database(db_path, products, closes, fx)
+    return generate_exports(products, closes, fx, n_trades, seed)
+
+
+def history_fetcher(closes, fx, seed=0):
+    """
+    Returns a stand-in for stock_service.fetch_yfinance_history serving the
+    synthetic closes (and the EUR/USD rates as "EURUSD=X") as yfinance-style
+    OHLCV history frames.
+    """
+    series = dict(closes.items())
+    series["EURUSD=X"] = fx
+
+    def fetch(symbol, start):
+        close = series[symbol]
+        close = close[close.index >= start]
+        rng = np.random.default_rng([seed, len(symbol), len(close)])
+        open_ = close.shift(1).fillna(close)
+        return pd.DataFrame(
+            {
+                "Open": open_,
+                "High": np.maximum(open_, close) * 1.005,
+                "Low": np.minimum(open_, close) * 0.995,
+                "Close": close,
+                "Volume": rng.integers(10_000, 1_000_000, len(close)),
+                "Dividends": 0.0,
+                "Stock Splits": 0.0,
+            },
+            index=pd.DatetimeIndex(close.index, name="Date"),
+        )
+
+    return fetch
+
+
+async def start_yahoo_stub(products, closes, latency=0.0):
+    """
+    Serves the Yahoo search and chart endpoints for the synthetic products on
+    a local port. Returns the aiohttp runner and the base URL to use as
+    ticker_service.YAHOO_BASE_URL.
+    """
+    from aiohttp import web
+
+    from ticker_service import normalize_product
+
+    symbols = {
+        normalize_product(name): ticker for name, (ticker, _) in products.items()
+    }
+    currencies = dict(products.values())
+
+    async def search(request):
+        await asyncio.sleep(latency)
+        ticker = symbols.get(request.query["q"])
+        quotes = [{"symbol": ticker}] if ticker else []
+        return web.json_response({"quotes": quotes})
+
+    async def chart(request):
+        await asyncio.sleep(latency)
+        ticker = request.match_info["ticker"]
+        if ticker not in closes:
+            return web.json_response({"chart": {"result": None}}, status=404)
+        meta = {
+            "regularMarketPrice": float(closes[ticker].iloc[-1]),
+            "currency": currencies[ticker],
+        }
+        return web.json_response({"chart": {"result": [{"meta": meta}]}})
+
+    app = web.Application()
+    app.router.add_get("/v1/finance/search", search)
+    app.router.add_get("/v8/finance/chart/{ticker}", chart)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f"http://127.0.0.1:{port}"
@@ -0,0 +1,192 @@
+"""
+Benchmark of the daily time-series assembly of the metrics.
+
+Builds a synthetic account export with --deposits deposits and a daily
+portfolio series over --years years, then times the old per-series
+reindex/merge/to_dict chain against process_data.build_time_series in both
+response layouts, including the JSON encoding, and compares payload sizes.
+Both must produce the same records.
+
+    cd backend && python -m benchmarks.time_series --years 20
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def build_time_series_merged(account_df, historical_portfolio_value):
+    """
+    The old assembly: each series reindexed on its own and merged on string dates.
+    """
+    amount_column = "Unnamed: 8"  # Column containing amounts
+
+    account_df = account_df[account_df["Fecha"].notna()]
+
+    # Calculate cumulative cash flow over time
+    cashflow_df = account_df[
+        account_df["Descripción"].str.contains(
+            "flatex Deposit|Flatex Instant Deposit|Ingreso Sofort/Trustly",
+            case=False,
+            na=False,
+        )
+    ]
+
+    cumulative_cashflow = cashflow_df[cashflow_df["Variación"] == "EUR"][amount_column][
+        ::-1
+    ].cumsum()
+    historical_cashflow = pd.DataFrame(
+        {"date": cashflow_df["Fecha"][::-1], "value": cumulative_cashflow}
+    ).ffill()
+
+    historical_cashflow["value"] = historical_cashflow["value"].round(2)
+
+    # Convert 'date' column to datetime format
+    historical_cashflow["date"] = pd.to_datetime(
+        historical_cashflow["date"], format="%d-%m-%Y"
+    )
+    # Remove duplicate dates by keeping the last occurrence
+    historical_cashflow = historical_cashflow.drop_duplicates(
+        subset="date", keep="last"
+    )
+    # Create a complete date range and reindex the DataFrame to fill missing dates
+    all_dates = pd.date_range(
+        historical_cashflow["date"].min(),
+        historical_portfolio_value["date"].max(),
+        freq="D",
+    )
+    historical_cashflow = (
+        historical_cashflow.set_index("date")
+        .reindex(all_dates)
+        .ffill()
+        .bfill()
+        .reset_index()
+    )
+    historical_cashflow.columns = ["date", "value"]
+
+    historical_portfolio_value = historical_portfolio_value.drop_duplicates(
+        subset="date", keep="last"
+    )
+    historical_portfolio_value = (
+        historical_portfolio_value.set_index("date")
+        .reindex(all_dates)
+        .ffill()
+        .bfill()
+        .reset_index()
+        .rename(columns={"index": "date"})
+    )
+
+    # Merge DataFrames on 'date'
+    merged_df = pd.merge(
+        historical_cashflow, historical_portfolio_value, on="date", how="right"
+    ).ffill()
+    merged_df.rename(
+        columns={"value_x": "cashflow_value", "value_y": "portfolio_value"},
+        inplace=True,
+    )
+
+    # Sum the 'value' fields
+    merged_df["value"] = merged_df["cashflow_value"] + merged_df["portfolio_value"]
+
+    combined_data = merged_df[["date", "value"]].copy()
+
+    combined_data["value"] = pd.to_numeric(combined_data["value"], errors="coerce")
+    combined_data["value"] = combined_data["value"].round(2)
+    historical_portfolio_value["value"] = pd.to_numeric(
+        historical_portfolio_value["value"], errors="coerce"
+    )
+    historical_portfolio_value["value"] = historical_portfolio_value["value"].round(2)
+    historical_cashflow["value"] = pd.to_numeric(
+        historical_cashflow["value"], errors="coerce"
+    )
+    historical_cashflow["value"] = historical_cashflow["value"].round(2)
+
+    # The dates stay datetime64 up to here, format them once for the response
+    for frame in (combined_data, historical_portfolio_value, historical_cashflow):
+        frame["date"] = frame["date"].dt.strftime("%Y-%m-%d")
+
+    combined_data = combined_data.to_dict(orient="records")
+    historical_portfolio_value = historical_portfolio_value.to_dict(orient="records")
+    historical_cashflow = historical_cashflow.to_dict(orient="records")
+    return historical_portfolio_value, historical_cashflow, combined_data
+
+
+def make_inputs(years, n_deposits, seed=0):
+    rng = np.random.default_rng(seed)
+    end = pd.Timestamp.now().normalize()
+    start = end - pd.Timedelta(days=365 * years)
+    days = pd.date_range(start, end, freq="D")
+    deposit_days = np.sort(rng.choice(days, n_deposits))[::-1]
+    account_df = pd.DataFrame(
+        {
+            "Fecha": pd.DatetimeIndex(deposit_days).strftime("%d-%m-%Y"),
+            "Descripción": "flatex Deposit",
+            "Variación": "EUR",
+            "Unnamed: 8": rng.uniform(100, 1000, n_deposits).round(2),
+        }
+    )
+    business_days = pd.bdate_range(start, end)
+    portfolio_value = pd.DataFrame(
+        {
+            "date": business_days.to_numpy(dtype="datetime64[D]"),
+            "value": rng.normal(0, 50, len(business_days)).cumsum().round(2),
+        }
+    )
+    return account_df, portfolio_value
+
+
+def best_time(func, repeats):
+    timings = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        result = func()
+        timings.append(time.perf_counter() - started)
+    return min(timings), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--years", type=int, default=20)
+    parser.add_argument("--deposits", type=int, default=500)
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+
+    sys.path.insert(0, BACKEND_DIR)
+    from process_data import build_time_series, time_series_columns, time_series_records
+    from responses import encode_json
+
+    account_df, portfolio_value = make_inputs(args.years, args.deposits)
+    keys = ("historical_portfolio_value", "historical_cashflow", "combined_data")
+
+    def merged():
+        return dict(zip(keys, build_time_series_merged(account_df, portfolio_value)))
+
+    def records():
+        series = build_time_series(account_df, portfolio_value)
+        return dict(zip(keys, time_series_records(series)))
+
+    def columnar():
+        series = build_time_series(account_df, portfolio_value)
+        return {"time_series": time_series_columns(series)}
+
+    results = {}
+    for label, build in (
+        ("merge + to_dict (before)", merged),
+        ("single frame, records", records),
+        ("single frame, columnar", columnar),
+    ):
+        seconds, body = best_time(lambda: encode_json(build()), args.repeats)
+        results[label] = body
+        print(f"{label:>26}: {seconds * 1000:7.1f} ms, {len(body) / 1024:8.1f} KiB")
+
+    assert results["merge + to_dict (before)"] == results["single frame, records"]
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""
+Micro-benchmark of the transaction parser.
+
+Generates a synthetic DEGIRO account export of about --rows rows and times the
+old row-by-row parsing (strptime and parse_transaction_description per row)
+against the vectorized parse_transactions.
+
+    cd backend && python -m benchmarks.transaction_parsing --rows 200000
+"""
+
+import argparse
+import io
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# The generator writes about this many account rows per trade
+ROWS_PER_TRADE = 4.4
+
+
+def parse_transaction_description(description, currency, tipo):
+    # Example description: "Compra 2 Visa Inc@278,5 USD"
+    description_parts = description.split("@")
+    quantity = float(description_parts[0].split()[1])
+    price = float(
+        description_parts[1]
+        .split()[0]
+        .replace(".", "")
+        .replace(",", ".")
+        .split("@")[-1]
+    )
+    if currency == "USD":
+        price = price / tipo  # Convert USD to EUR
+    return quantity, price
+
+
+def parse_row_by_row(df):
+    df = df[~df["ID Orden"].isna()]
+    df_eur = df[df["Variación"] == "EUR"]
+    df_usd = df[df["Variación"] == "USD"].copy()
+    df_usd.loc[:, "Tipo"] = df_usd["Tipo"].ffill()
+    df = pd.concat([df_eur, df_usd])
+
+    trades = []
+    for _, row in df[::-1].iterrows():
+        description = row["Descripción"]
+        date = datetime.strptime(row["Fecha"], "%d-%m-%Y")
+        if "Compra" in description or "Venta" in description:
+            quantity, price = parse_transaction_description(
+                description, row["Variación"], row["Tipo"]
+            )
+            trades.append((row["Producto"], quantity, price, date))
+    return trades
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=200_000)
+    parser.add_argument("--products", type=int, default=50)
+    parser.add_argument("--years", type=int, default=10)
+    args = parser.parse_args()
+
+    sys.path.insert(0, BACKEND_DIR)
+    from benchmarks.synthetic import generate_exports, make_products, price_history
+    from transactions import parse_transactions, malformed_transactions
+
+    end = datetime.now()
+    products = make_products(args.products)
+    closes, fx = price_history(products, end - timedelta(days=365 * args.years), end)
+    account_csv, _ = generate_exports(
+        products, closes, fx, int(args.rows / ROWS_PER_TRADE)
+    )
+    df = pd.read_csv(io.BytesIO(account_csv), decimal=",")
+    print(f"{len(df)} account rows")
+
+    started = time.perf_counter()
+    trades = parse_row_by_row(df)
+    before = time.perf_counter() - started
+
+    started = time.perf_counter()
+    parsed = parse_transactions(df)
+    after = time.perf_counter() - started
+
+    parsed_trades = parsed[parsed["side"].notna()]
+    assert len(parsed_trades) == len(trades)
+    assert malformed_transactions(parsed).empty
+    print(f"{'row by row (before)':>24}: {before:.3f}s")
+    print(f"{'vectorized (after)':>24}: {after:.3f}s ({before / after:.0f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""
+Load test for the /upload endpoint.
+
+Serves the app with uvicorn on a local port, seeds a throwaway database with
+synthetic market data and fires N parallel uploads, once with the blocking work
+running inline on the event loop (the old behaviour) and once on the worker pool.
+While the uploads run, /docs is polled to measure how long the loop is blocked.
+
+    cd backend && python -m benchmarks.upload_load --parallel 8 --requests 32
+"""
+
+import argparse
+import asyncio
+import os
+import socket
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(app, port):
+    import uvicorn
+
+    server = uvicorn.Server(
+        uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning")
+    )
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.05)
+    return server, thread
+
+
+async def run_load(url, account_csv, portfolio_csv, parallel, total):
+    import aiohttp
+
+    semaphore = asyncio.Semaphore(parallel)
+    latencies = []
+
+    async def upload(session):
+        data = aiohttp.FormData()
+        data.add_field("account", account_csv, filename="Account.csv")
+        data.add_field("portfolio", portfolio_csv, filename="Portfolio.csv")
+        async with semaphore:
+            started = time.perf_counter()
+            async with session.post(url, data=data) as response:
+                await response.read()
+                response.raise_for_status()
+            latencies.append(time.perf_counter() - started)
+
+    # A cheap request sent while the uploads run shows whether the loop is free
+    probe_url = url.rsplit("/", 1)[0] + "/docs"
+    probe_latencies = []
+
+    async def probe(session, done):
+        while not done.is_set():
+            started = time.perf_counter()
+            async with session.get(probe_url) as response:
+                await response.read()
+            probe_latencies.append(time.perf_counter() - started)
+            await asyncio.sleep(0.05)
+
+    timeout = aiohttp.ClientTimeout(total=None)
+    async with aiohttp.ClientSession(timeout=timeout) as session:
+        done = asyncio.Event()
+        prober = asyncio.create_task(probe(session, done))
+        started = time.perf_counter()
+        await asyncio.gather(*(upload(session) for _ in range(total)))
+        elapsed = time.perf_counter() - started
+        done.set()
+        await prober
+
+    latencies.sort()
+    return {
+        "requests": total,
+        "parallel": parallel,
+        "seconds": round(elapsed, 3),
+        "requests_per_sec": round(total / elapsed, 2),
+        "p50_ms": round(latencies[len(latencies) // 2] * 1000, 1),
+        "max_ms": round(latencies[-1] * 1000, 1),
+        "probe_max_ms": round(max(probe_latencies) * 1000, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--parallel", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=32)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--trades", type=int, default=500)
+    parser.add_argument("--products", type=int, default=20)
+    parser.add_argument("--years", type=int, default=10)
+    args = parser.parse_args()
+
+    # The services use relative database and cache paths, so work in a scratch dir
+    sys.path.insert(0, BACKEND_DIR)
+    os.chdir(tempfile.mkdtemp(prefix="upload_load_"))
+
+    import workers
+    from benchmarks.synthetic import build_dataset
+    from main import app
+
+    account_csv, portfolio_csv = build_dataset(
+        "stocks.db", args.trades, args.products, args.years
+    )
+
+    port = free_port()
+    server, thread = start_server(app, port)
+    url = f"http://127.0.0.1:{port}/upload"
+    try:
+        for label, executor in (
+            ("inline (before)", None),
+            (f"{args.workers} workers (after)", ThreadPoolExecutor(args.workers)),
+        ):
+            workers.set_executor(executor)
+            result = asyncio.run(
+                run_load(url, account_csv, portfolio_csv, args.parallel, args.requests)
+            )
+            print(f"{label:>24}: {result}")
+    finally:
+        server.should_exit = True
+        thread.join()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,220 @@
+import json
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import NamedTuple, Optional
+
+from db import DB_PATH, get_connection
+from instrumentation import count
+from workers import get_executor
+
+
+class Namespace(NamedTuple):
+    """A cache namespace and the default lifetime of its entries."""
+
+    name: str
+    ttl: Optional[float] = None  # seconds, None = no expiry
+    until_midnight: bool = False  # expire at the end of the local day
+
+
+SYMBOLS = Namespace("symbols")
+SPOT_PRICES = Namespace("spot_prices", until_midnight=True)
+FX = Namespace("fx", until_midnight=True)
+
+# Buffered writes are flushed in the background once this many entries are dirty
+CACHE_FLUSH_BATCH_SIZE = 100
+
+
+def _end_of_day():
+    tomorrow = datetime.now().date() + timedelta(days=1)
+    return datetime.combine(tomorrow, datetime.min.time()).timestamp()
+
+
+class CacheStore:
+    """
+    Key/value cache with namespaces and per-entry expiry, persisted in the
+    cache_entries table of the SQLite database.
+
+    Each namespace is read once on first use. Writes are buffered and flushed
+    in one transaction as per-entry upserts, so concurrent workers only ever
+    replace the entries they wrote themselves. set() never writes to SQLite,
+    a full buffer is flushed by a blocking worker.
+    """
+
+    def __init__(self, db_path=DB_PATH, flush_batch_size=CACHE_FLUSH_BATCH_SIZE):
+        self.db_path = db_path
+        self.flush_batch_size = flush_batch_size
+        self._entries = {}  # namespace -> {key: (value, expires_at)}
+        self._dirty = {}  # (namespace, key) -> (value, expires_at)
+        self._lock = threading.RLock()
+        self._flush_scheduled = False
+
+    def _namespace(self, namespace):
+        entries = self._entries.get(namespace.name)
+        if entries is None:
+            conn = get_connection(self.db_path)
+            rows = conn.execute(
+                """
+                SELECT key, value, expires_at FROM cache_entries
+                WHERE namespace = ? AND (expires_at IS NULL OR expires_at > ?)
+            """,
+                (namespace.name, time.time()),
+            ).fetchall()
+            entries = {
+                key: (json.loads(value), expires_at) for key, value, expires_at in rows
+            }
+            self._entries[namespace.name] = entries
+        return entries
+
+    def get(self, namespace, key, default=None):
+        """
+        Returns the cached value of `key`, or `default` if missing or expired.
+        """
+        with self._lock:
+            entry = self._namespace(namespace).get(key)
+        if entry is None or (entry[1] is not None and entry[1] <= time.time()):
+            count(f"cache.{namespace.name}.misses")
+            return default
+        count(f"cache.{namespace.name}.hits")
+        return entry[0]
+
+    def get_many(self, namespace, keys):
+        """
+        Returns {key: value} for the keys that are cached and not expired.
+        """
+        now = time.time()
+        with self._lock:
+            entries = self._namespace(namespace)
+            found = {key: entries.get(key) for key in keys}
+        values = {
+            key: entry[0]
+            for key, entry in found.items()
+            if entry is not None and (entry[1] is None or entry[1] > now)
+        }
+        count(f"cache.{namespace.name}.hits", len(values))
+        count(f"cache.{namespace.name}.misses", len(found) - len(values))
+        return values
+
+    def set(self, namespace, key, value, ttl=None):
+        """
+        Caches `value` under `key`. The entry expires after `ttl` seconds, or
+        according to the namespace default. The write is buffered.
+        """
+        if ttl is not None:
+            expires_at = time.time() + ttl
+        elif namespace.until_midnight:
+            expires_at = _end_of_day()
+        elif namespace.ttl is not None:
+            expires_at = time.time() + namespace.ttl
+        else:
+            expires_at = None
+
+        with self._lock:
+            self._namespace(namespace)[key] = (value, expires_at)
+            self._dirty[(namespace.name, key)] = (value, expires_at)
+            schedule = (
+                len(self._dirty) >= self.flush_batch_size and not self._flush_scheduled
+            )
+            if schedule:
+                self._flush_scheduled = True
+        if schedule:
+            self._schedule_flush()
+
+    def _schedule_flush(self):
+        executor = get_executor()
+        if executor is None:
+            # Blocking work runs inline (BLOCKING_WORKERS=0)
+            self._background_flush()
+            return
+        try:
+            executor.submit(self._background_flush)
+        except RuntimeError:
+            # Executor shut down, the next explicit flush writes the entries
+            with self._lock:
+                self._flush_scheduled = False
+
+    def _background_flush(self):
+        try:
+            self.flush()
+        except sqlite3.Error as e:
+            print(f"Warning: cache flush failed, retrying on the next flush ({e})")
+        finally:
+            with self._lock:
+                self._flush_scheduled = False
+
+    def flush(self):
+        """
+        Writes all buffered entries and purges expired ones in one transaction.
+        """
+        with self._lock:
+            dirty, self._dirty = self._dirty, {}
+        if not dirty:
+            return
+
+        conn = get_connection(self.db_path)
+        try:
+            with conn:
+                conn.executemany(
+                    """
+                    INSERT INTO cache_entries (namespace, key, value, expires_at)
+                    VALUES (?, ?, ?, ?)
+                    ON CONFLICT (namespace, key) DO UPDATE SET
+                        value = excluded.value,
+                        expires_at = excluded.expires_at
+                """,
+                    [
+                        (namespace, key, json.dumps(value), expires_at)
+                        for (namespace, key), (value, expires_at) in dirty.items()
+                    ],
+                )
+                conn.execute(
+                    "DELETE FROM cache_entries WHERE expires_at <= ?", (time.time(),)
+                )
+        except BaseException:
+            with self._lock:
+                # Entries set while the write was running are newer, keep them
+                dirty.update(self._dirty)
+                self._dirty = dirty
+            raise
+
+    def clear(self, namespace):
+        """
+        Drops every entry of `namespace`, in memory and on disk.
+        """
+        with self._lock:
+            self._entries[namespace.name] = {}
+            self._dirty = {
+                key: entry
+                for key, entry in self._dirty.items()
+                if key[0] != namespace.name
+            }
+            conn = get_connection(self.db_path)
+            with conn:
+                conn.execute(
+                    "DELETE FROM cache_entries WHERE namespace = ?", (namespace.name,)
+                )
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_cache_store(db_path=DB_PATH):
+    """
+    Returns the process-wide cache store of `db_path`.
+    """
+    with _stores_lock:
+        if db_path not in _stores:
+            _stores[db_path] = CacheStore(db_path)
+        return _stores[db_path]
+
+
+def flush_cache_stores():
+    """
+    Flushes the buffered writes of every open cache store.
+    """
+    with _stores_lock:
+        stores = list(_stores.values())
+    for store in stores:
+        store.flush()
@@ -1,11 +1,68 @@
+import os
 import sqlite3
+import threading
 
+from instrumentation import count
+
+# The one database of the backend, shared by every service
+DB_PATH = os.environ.get("PORTFOLIO_DB_PATH", "stocks.db")
+
+# Prepared statements kept per connection, reused by repeated queries
+STATEMENT_CACHE_SIZE = 256
+
+# Settings of every connection: WAL lets readers run while a writer commits, and
+# NORMAL sync is durable in WAL mode except on power loss
+SQLITE_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "cache_size": -64 * 1024,  # negative = KiB, so 64 MiB of page cache
+    "mmap_size": 256 * 1024 * 1024,
+    "temp_store": "MEMORY",
+    "busy_timeout": 5000,  # ms to wait for a concurrent writer
+}
+
+
+class CountingCursor(sqlite3.Cursor):
+    """Cursor that counts its statements in the "db.queries" counter."""
+
+    def execute(self, *args):
+        count("db.queries")
+        return super().execute(*args)
+
+    def executemany(self, *args):
+        count("db.queries")
+        return super().executemany(*args)
+
+
+class CountingConnection(sqlite3.Connection):
+    """Connection whose cursors, including the implicit ones, are counted."""
+
+    def cursor(self, factory=CountingCursor):
+        return super().cursor(factory)
+
+    def execute(self, *args):
+        return self.cursor().execute(*args)
+
+    def executemany(self, *args):
+        return self.cursor().executemany(*args)
+
+
+def connect(db_path=DB_PATH, check_same_thread=True):
+    """
+    Opens a connection to `db_path` with SQLITE_PRAGMAS applied.
+    """
+    conn = sqlite3.connect(
+        db_path,
+        cached_statements=STATEMENT_CACHE_SIZE,
+        check_same_thread=check_same_thread,
+        factory=CountingConnection,
+    )
+    for name, value in SQLITE_PRAGMAS.items():
+        conn.execute(f"PRAGMA {name} = {value}")
+    return conn
 
-# Database setup
-def create_tables(db_name):
-    conn = sqlite3.connect(db_name)
-    cursor = conn.cursor()
 
+def _create_base_tables(cursor):
     # Create a table for storing ticker information
     cursor.execute(
         """
@@ -62,7 +119,7 @@ def create_tables(db_name):
     """
     )
 
-    # Create profit_loss table
+    # Create profit_loss table, rows are keyed by the fingerprint of a lot set
     cursor.execute(
         """
         CREATE TABLE IF NOT EXISTS profit_loss (
@@ -70,10 +127,294 @@ def create_tables(db_name):
             stock_id INTEGER,
             date TEXT,
             profit_loss REAL,
+            fingerprint TEXT,
             FOREIGN KEY (stock_id) REFERENCES tickers(id)
         )
     """
     )
 
-    conn.commit()
+
+def _add_profit_loss_fingerprint(cursor):
+    # profit_loss rows are keyed by the fingerprint of a lot set
+    cursor.execute("PRAGMA table_info(profit_loss)")
+    if "fingerprint" not in [column[1] for column in cursor.fetchall()]:
+        cursor.execute("ALTER TABLE profit_loss ADD COLUMN fingerprint TEXT")
+
+
+def _add_lookup_indexes(cursor):
+    # One ticker per product; older databases may hold duplicates
+    cursor.execute(
+        """
+        DELETE FROM tickers
+        WHERE id NOT IN (SELECT MIN(id) FROM tickers GROUP BY product)
+    """
+    )
+    cursor.execute(
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_tickers_product ON tickers (product)"
+    )
+
+    # Price lookups filter on Ticker first, the (Date, Ticker) key cannot serve
+    # them; including Close makes the index covering
+    cursor.execute(
+        """
+        CREATE INDEX IF NOT EXISTS idx_stock_data_ticker_date
+        ON stock_data (Ticker, Date, Close)
+    """
+    )
+    cursor.execute(
+        """
+        CREATE INDEX IF NOT EXISTS idx_eur_usd_exchange_date_rate
+        ON eur_usd_exchange (date, exchange_rate)
+    """
+    )
+    cursor.execute("DROP INDEX IF EXISTS idx_profit_loss_fingerprint")
+    cursor.execute(
+        """
+        CREATE INDEX IF NOT EXISTS idx_profit_loss_fingerprint_date
+        ON profit_loss (fingerprint, date, profit_loss)
+    """
+    )
+
+
+def _create_cache_entries(cursor):
+    # Persistent key/value entries of cache_store.CacheStore
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS cache_entries (
+            namespace TEXT,
+            key TEXT,
+            value TEXT,
+            expires_at REAL,
+            PRIMARY KEY (namespace, key)
+        )
+    """
+    )
+
+
+def _add_exchange_rate_pairs(cursor):
+    # Rates of every currency pair in one table; eur_usd_exchange becomes a
+    # view of its EURUSD rows so existing readers keep working
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS exchange_rates (
+            pair TEXT,
+            date TEXT,
+            rate REAL,
+            date_added TEXT,
+            PRIMARY KEY (pair, date)
+        )
+    """
+    )
+    cursor.execute(
+        """
+        CREATE INDEX IF NOT EXISTS idx_exchange_rates_pair_date_rate
+        ON exchange_rates (pair, date, rate)
+    """
+    )
+    cursor.execute(
+        """
+        INSERT OR IGNORE INTO exchange_rates (pair, date, rate, date_added)
+        SELECT 'EURUSD', date, exchange_rate, date_added FROM eur_usd_exchange
+        ORDER BY date
+    """
+    )
+    cursor.execute("DROP TABLE eur_usd_exchange")
+    cursor.execute(
+        """
+        CREATE VIEW eur_usd_exchange AS
+        SELECT date, rate AS exchange_rate, date_added FROM exchange_rates
+        WHERE pair = 'EURUSD'
+    """
+    )
+
+    # The day each pair was last fetched, repeated syncs that day are no-ops
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS fx_sync (
+            pair TEXT PRIMARY KEY,
+            synced_on TEXT
+        )
+    """
+    )
+
+
+def _add_profit_loss_keys(cursor):
+    # One row per (fingerprint, date); concurrent uploads could store a
+    # column's history twice before this index existed
+    cursor.execute(
+        """
+        DELETE FROM profit_loss
+        WHERE id NOT IN (
+            SELECT MAX(id) FROM profit_loss GROUP BY fingerprint, date
+        )
+    """
+    )
+    cursor.execute(
+        """
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_profit_loss_fingerprint_date_key
+        ON profit_loss (fingerprint, date)
+    """
+    )
+
+    # When each fingerprint was last used and the column it belongs to, so the
+    # rows of replaced lot sets can be dropped (see materialize_profit_loss)
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS profit_loss_fingerprints (
+            fingerprint TEXT PRIMARY KEY,
+            column_key TEXT,
+            used_at REAL
+        )
+    """
+    )
+    cursor.execute(
+        """
+        CREATE INDEX IF NOT EXISTS idx_profit_loss_fingerprints_column
+        ON profit_loss_fingerprints (column_key, used_at)
+    """
+    )
+    cursor.execute(
+        """
+        INSERT OR IGNORE INTO profit_loss_fingerprints (fingerprint, used_at)
+        SELECT DISTINCT fingerprint, CAST(strftime('%s', 'now') AS REAL)
+        FROM profit_loss
+        WHERE fingerprint IS NOT NULL
+    """
+    )
+
+
+def _create_data_versions(cursor):
+    # Counters bumped by every write to the market data tables, see
+    # bump_data_version; upserts of existing rows change neither MAX(rowid)
+    # nor MAX(date), so those cannot tell that the data changed
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS data_versions (
+            name TEXT PRIMARY KEY,
+            version INTEGER NOT NULL
+        )
+    """
+    )
+
+
+def _add_profit_loss_currency(cursor):
+    # Currency of each lot set, so stored rows of USD lots can be dropped when
+    # the EUR/USD rates they were converted with change; NULL until next used
+    cursor.execute("ALTER TABLE profit_loss_fingerprints ADD COLUMN currency TEXT")
+
+
+# Schema migrations in order; PRAGMA user_version holds how many have run
+MIGRATIONS = [
+    _create_base_tables,
+    _add_profit_loss_fingerprint,
+    _add_lookup_indexes,
+    _create_cache_entries,
+    _add_exchange_rate_pairs,
+    _add_profit_loss_keys,
+    _create_data_versions,
+    _add_profit_loss_currency,
+]
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
+def schema_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+# Database setup
+def create_tables(db_name=DB_PATH):
+    """
+    Creates the schema of `db_name`, or migrates it to SCHEMA_VERSION. Each
+    pending migration runs once, in one transaction with the version bump.
+    """
+    conn = connect(db_name)
+    if schema_version(conn) < SCHEMA_VERSION:
+        conn.isolation_level = None  # the transaction is managed explicitly
+        cursor = conn.cursor()
+        cursor.execute("BEGIN IMMEDIATE")
+        try:
+            # Another process may have migrated while we waited for the lock
+            version = schema_version(conn)
+            for number, migration in enumerate(MIGRATIONS, start=1):
+                if number > version:
+                    migration(cursor)
+                    cursor.execute(f"PRAGMA user_version = {number}")
+            cursor.execute("COMMIT")
+        except BaseException:
+            cursor.execute("ROLLBACK")
+            raise
     conn.close()
+
+
+def bump_data_version(conn, name):
+    """
+    Records that the data of `name` (e.g. a table) changed. Call it in the
+    transaction of the write.
+    """
+    conn.execute(
+        """
+        INSERT INTO data_versions (name, version) VALUES (?, 1)
+        ON CONFLICT (name) DO UPDATE SET version = version + 1
+    """,
+        (name,),
+    )
+
+
+def data_versions(conn):
+    """
+    Returns {name: version} of everything bump_data_version was called for.
+    """
+    return dict(conn.execute("SELECT name, version FROM data_versions").fetchall())
+
+
+# Long-lived connections: one per (thread, database), closed at shutdown
+_local = threading.local()
+_connections = []
+_connections_lock = threading.Lock()
+_ready = set()  # databases whose schema is up to date in this process
+
+
+def init_db(db_path=DB_PATH):
+    """
+    Creates or migrates the schema of `db_path` once per process.
+    """
+    with _connections_lock:
+        if db_path in _ready:
+            return
+        create_tables(db_path)
+        _ready.add(db_path)
+
+
+def get_connection(db_path=DB_PATH):
+    """
+    Returns the calling thread's connection to `db_path`, opening it (and
+    making sure the schema exists) on first use. The connection stays open
+    until close_connections(), so callers must not close it; writes should run
+    in `with conn:` so they commit or roll back as a unit.
+    """
+    connections = getattr(_local, "connections", None)
+    if connections is None:
+        connections = _local.connections = {}
+    conn = connections.get(db_path)
+    if conn is None:
+        init_db(db_path)
+        # Only this thread uses it, but close_connections may run elsewhere
+        conn = connect(db_path, check_same_thread=False)
+        connections[db_path] = conn
+        with _connections_lock:
+            _connections.append(conn)
+    return conn
+
+
+def close_connections():
+    """
+    Closes every connection opened by get_connection, in all threads.
+    """
+    global _local
+    with _connections_lock:
+        connections = list(_connections)
+        _connections.clear()
+        _ready.clear()
+    for conn in connections:
+        conn.close()
+    _local = threading.local()
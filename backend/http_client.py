@@ -0,0 +1,100 @@
+import os
+import asyncio
+import aiohttp
+
+from instrumentation import count
+
+# Connection pool and retry settings for all outgoing HTTP calls
+HTTP_CONNECTION_LIMIT = int(os.environ.get("HTTP_CONNECTION_LIMIT", "100"))
+HTTP_CONNECTION_LIMIT_PER_HOST = int(
+    os.environ.get("HTTP_CONNECTION_LIMIT_PER_HOST", "20")
+)
+HTTP_KEEPALIVE_SECONDS = 30
+HTTP_TIMEOUT_SECONDS = float(os.environ.get("HTTP_TIMEOUT_SECONDS", "10"))
+HTTP_RETRIES = 3
+HTTP_BACKOFF_SECONDS = 0.5
+
+# Yahoo answers 429 to requests without a browser-like user agent
+HTTP_HEADERS = {"User-Agent": "Mozilla/5.0 (portfolio-tracker)"}
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+_session = None
+_session_loop = None
+
+
+async def start_http_client():
+    """
+    Opens the application-wide HTTP session. Called on FastAPI startup.
+    """
+    global _session, _session_loop
+    await close_http_client()
+    _session = aiohttp.ClientSession(
+        connector=aiohttp.TCPConnector(
+            limit=HTTP_CONNECTION_LIMIT,
+            limit_per_host=HTTP_CONNECTION_LIMIT_PER_HOST,
+            keepalive_timeout=HTTP_KEEPALIVE_SECONDS,
+        ),
+        timeout=aiohttp.ClientTimeout(total=HTTP_TIMEOUT_SECONDS),
+        headers=HTTP_HEADERS,
+    )
+    _session_loop = asyncio.get_running_loop()
+    return _session
+
+
+async def close_http_client():
+    """
+    Closes the application-wide HTTP session. Called on FastAPI shutdown.
+    """
+    global _session, _session_loop
+    # A session bound to another (finished) event loop can only be dropped
+    if (
+        _session is not None
+        and not _session.closed
+        and _session_loop is asyncio.get_running_loop()
+    ):
+        await _session.close()
+    _session = None
+    _session_loop = None
+
+
+async def get_http_client():
+    """
+    Returns the shared session, opening one if the app did not (e.g. in scripts).
+    """
+    if (
+        _session is None
+        or _session.closed
+        or _session_loop is not asyncio.get_running_loop()
+    ):
+        return await start_http_client()
+    return _session
+
+
+async def fetch_json(url, params=None):
+    """
+    GETs `url` through the shared session and returns the decoded JSON body, or
+    None if the request keeps failing. Connection errors, timeouts and 429/5xx
+    answers are retried with exponential backoff.
+    """
+    session = await get_http_client()
+    for attempt in range(HTTP_RETRIES + 1):
+        count("http.requests")
+        try:
+            async with session.get(url, params=params) as response:
+                if response.status == 200:
+                    return await response.json(content_type=None)
+                if response.status not in RETRY_STATUSES:
+                    count("http.failures")
+                    print(f"Warning: {url} answered {response.status}")
+                    return None
+                error = f"status {response.status}"
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            error = repr(e)
+
+        if attempt < HTTP_RETRIES:
+            await asyncio.sleep(HTTP_BACKOFF_SECONDS * 2**attempt)
+
+    count("http.failures")
+    print(f"Warning: giving up on {url} after {HTTP_RETRIES + 1} attempts ({error})")
+    return None
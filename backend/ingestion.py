@@ -0,0 +1,158 @@
+import hashlib
+import io
+import os
+import sys
+import time
+from typing import NamedTuple, Optional
+
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+from amounts import ACCOUNT_NUMERIC_COLUMNS, PORTFOLIO_NUMERIC_COLUMNS, parse_numbers
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Rows parsed per chunk, and bytes read per step when hashing an upload
+INGEST_CHUNK_ROWS = int(os.environ.get("INGEST_CHUNK_ROWS", "200000"))
+UPLOAD_READ_BYTES = 1024 * 1024
+
+# The account columns the pipeline uses, with compact dtypes. Numeric columns
+# (see ACCOUNT_NUMERIC_COLUMNS) are parsed by the CSV reader and parse_numbers.
+ACCOUNT_DTYPES = {
+    "Fecha": str,
+    "Fecha valor": str,
+    "Producto": "category",
+    "Descripción": str,
+    "Variación": "category",
+    "Saldo": "category",
+    "ID Orden": str,
+}
+ACCOUNT_COLUMNS = set(ACCOUNT_DTYPES) | set(ACCOUNT_NUMERIC_COLUMNS)
+
+
+class IngestStats(NamedTuple):
+    """Size and speed of one CSV ingestion."""
+
+    rows: int
+    seconds: float
+    rows_per_sec: float
+    peak_rss_bytes: Optional[int]  # high-water mark of the process
+
+    def summary(self):
+        peak = "n/a" if self.peak_rss_bytes is None else self.peak_rss_bytes >> 20
+        return (
+            f"{self.rows} rows in {self.seconds}s ({self.rows_per_sec} rows/s), "
+            f"peak RSS {peak} MiB"
+        )
+
+
+def peak_rss_bytes():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+async def hash_upload(upload, read_bytes=UPLOAD_READ_BYTES):
+    """
+    Returns the sha256 of an UploadFile, read in chunks, and rewinds it.
+    """
+    digest = hashlib.sha256()
+    await upload.seek(0)
+    while True:
+        chunk = await upload.read(read_bytes)
+        if not chunk:
+            break
+        digest.update(chunk)
+    await upload.seek(0)
+    return digest.hexdigest()
+
+
+def _as_source(source):
+    return io.BytesIO(source) if isinstance(source, bytes) else source
+
+
+def _concat_chunks(chunks):
+    """
+    Concatenates DataFrame chunks, merging the per-chunk categories of
+    categorical columns instead of falling back to object columns.
+    """
+    if len(chunks) == 1:
+        return chunks[0]
+    categorical = [
+        column
+        for column, dtype in chunks[0].dtypes.items()
+        if isinstance(dtype, pd.CategoricalDtype)
+    ]
+    df = pd.concat([chunk.drop(columns=categorical) for chunk in chunks])
+    for column in categorical:
+        # Categories of an all-empty chunk are not strings, align them first
+        parts = [
+            chunk[column].cat.set_categories(chunk[column].cat.categories.astype(str))
+            for chunk in chunks
+        ]
+        merged = union_categoricals(parts, sort_categories=True)
+        df[column] = pd.Categorical(merged)
+    return df[chunks[0].columns]
+
+
+def read_account_csv(source, chunk_rows=INGEST_CHUNK_ROWS):
+    """
+    Reads an account export (bytes or a binary file object) in chunks of
+    `chunk_rows` rows, keeping only the columns the pipeline uses with compact
+    dtypes: categories for products and currencies, strings for dates and
+    descriptions and float64 amounts.
+
+    Returns the DataFrame, a mask of the unparseable numeric cells and the
+    IngestStats of the read.
+    """
+    started = time.perf_counter()
+    chunks, masks = [], []
+    reader = pd.read_csv(
+        _as_source(source),
+        usecols=lambda column: column in ACCOUNT_COLUMNS,
+        dtype=ACCOUNT_DTYPES,
+        decimal=",",
+        chunksize=chunk_rows,
+    )
+    for chunk in reader:
+        mask = pd.DataFrame(index=chunk.index)
+        for column in ACCOUNT_NUMERIC_COLUMNS:
+            if column in chunk.columns:
+                chunk[column], mask[column] = parse_numbers(chunk[column])
+        chunks.append(chunk)
+        masks.append(mask)
+
+    if chunks:
+        df = _concat_chunks(chunks)
+        unparseable = pd.concat(masks)
+    else:
+        df = pd.DataFrame(columns=list(ACCOUNT_DTYPES))
+        unparseable = pd.DataFrame(index=df.index)
+    if unparseable.to_numpy().any():
+        print(f"Warning: {int(unparseable.to_numpy().sum())} unparseable amounts")
+
+    seconds = time.perf_counter() - started
+    stats = IngestStats(
+        rows=len(df),
+        seconds=round(seconds, 3),
+        rows_per_sec=round(len(df) / seconds) if seconds else 0,
+        peak_rss_bytes=peak_rss_bytes(),
+    )
+    return df, unparseable, stats
+
+
+def read_portfolio_csv(source):
+    """
+    Reads a portfolio export (bytes or a binary file object) with its numeric
+    columns as floats. Returns the DataFrame and a mask of the unparseable cells.
+    """
+    df = pd.read_csv(_as_source(source), decimal=",")
+    unparseable = pd.DataFrame(index=df.index)
+    for column in PORTFOLIO_NUMERIC_COLUMNS:
+        if column in df.columns:
+            df[column], unparseable[column] = parse_numbers(df[column])
+    return df, unparseable
@@ -0,0 +1,122 @@
+import contextvars
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+# On-demand sampling profiles (GET /debug/profile) are off unless enabled
+PROFILING_ENABLED = os.environ.get("PROFILING_ENABLED", "") == "1"
+PROFILE_MAX_SECONDS = 60
+PROFILE_INTERVAL_SECONDS = 0.005
+
+_lock = threading.Lock()
+_counters = Counter()
+_spans = {}  # name -> [count, total seconds, max seconds]
+
+# Span durations of the request being handled, see start_request
+_request_spans = contextvars.ContextVar("request_spans", default=None)
+
+
+def count(name, n=1):
+    """
+    Adds `n` to the process-wide counter `name`.
+    """
+    with _lock:
+        _counters[name] += n
+
+
+def _record(name, seconds):
+    with _lock:
+        stats = _spans.get(name)
+        if stats is None:
+            _spans[name] = [1, seconds, seconds]
+        else:
+            stats[0] += 1
+            stats[1] += seconds
+            stats[2] = max(stats[2], seconds)
+    request = _request_spans.get()
+    if request is not None:
+        # A request can time the same stage more than once, add them up
+        request[name] = request.get(name, 0.0) + seconds
+
+
+@contextmanager
+def span(name):
+    """
+    Times the enclosed block as stage `name`, in the process-wide aggregates
+    and in the Server-Timing of the current request.
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        _record(name, time.perf_counter() - started)
+
+
+def start_request():
+    """
+    Starts collecting the spans of the current request (task). Returns the
+    {name: seconds} dict they are added to.
+    """
+    request = {}
+    _request_spans.set(request)
+    return request
+
+
+def server_timing(request):
+    """
+    Formats the spans of a request as a Server-Timing header value.
+    """
+    return ", ".join(
+        f"{name};dur={seconds * 1000:.1f}" for name, seconds in request.items()
+    )
+
+
+def metrics_snapshot():
+    """
+    Returns the counters and the count, total and max duration of each span.
+    """
+    with _lock:
+        return {
+            "counters": dict(_counters),
+            "spans": {
+                name: {
+                    "count": stats[0],
+                    "total_ms": round(stats[1] * 1000, 3),
+                    "max_ms": round(stats[2] * 1000, 3),
+                }
+                for name, stats in _spans.items()
+            },
+        }
+
+
+def reset_metrics():
+    with _lock:
+        _counters.clear()
+        _spans.clear()
+
+
+def sample_profile(seconds, interval=PROFILE_INTERVAL_SECONDS):
+    """
+    Samples the stacks of all other threads every `interval` seconds for
+    `seconds` seconds. Returns collapsed stacks ("outer;...;inner count" lines,
+    the input of flame graph tools), most frequent first.
+    """
+    samples = Counter()
+    me = threading.get_ident()
+    deadline = time.perf_counter() + min(seconds, PROFILE_MAX_SECONDS)
+    while time.perf_counter() < deadline:
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == me:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                filename = os.path.basename(code.co_filename)
+                stack.append(f"{code.co_name} ({filename}:{code.co_firstlineno})")
+                frame = frame.f_back
+            samples[";".join(reversed(stack))] += 1
+        time.sleep(interval)
+    return "".join(f"{stack} {n}\n" for stack, n in samples.most_common())
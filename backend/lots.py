@@ -0,0 +1,154 @@
+import os
+from datetime import timedelta
+
+# How sales are matched against the lots held: "fifo", "lifo" or "average"
+LOT_METHODS = ("fifo", "lifo", "average")
+LOT_METHOD = os.environ.get("LOT_METHOD", "fifo")
+
+# Quantities below this are rounding noise, not shares
+QUANTITY_EPSILON = 1e-9
+
+# Consumed FIFO lots are dropped once the head passes this many of them
+COMPACT_MIN_HEAD = 64
+
+
+class LotBook:
+    """
+    The lots of one product, matched against sales by `method`.
+
+    Open lots are kept as parallel lists with a head pointer, so FIFO consumes
+    from the front and LIFO pops from the back in amortized O(1), and partially
+    sold lots are split into a closed and an open part. Closed lots are
+    (quantity, cost_per_unit, start_date, end_date) tuples, with both dates
+    inclusive as in the profit/loss calculation.
+
+    In "average" mode the open shares form one pool at their average cost. Each
+    change of the pool closes the previous segment, so every day is covered by
+    exactly one segment holding the shares of that day.
+    """
+
+    __slots__ = (
+        "currency",
+        "method",
+        "quantities",
+        "costs",
+        "starts",
+        "head",
+        "closed",
+    )
+
+    def __init__(self, currency, method=LOT_METHOD):
+        if method not in LOT_METHODS:
+            raise ValueError(f"Unknown lot method {method!r}, expected {LOT_METHODS}")
+        self.currency = currency
+        self.method = method
+        self.quantities = []
+        self.costs = []
+        self.starts = []
+        self.head = 0
+        self.closed = []
+
+    def buy(self, quantity, cost_per_unit, date):
+        if self.method == "average":
+            self._buy_average(quantity, cost_per_unit, date)
+            return
+        self.quantities.append(quantity)
+        self.costs.append(cost_per_unit)
+        self.starts.append(date)
+
+    def sell(self, quantity, date):
+        """
+        Closes `quantity` shares on `date` and returns the part that was not held.
+        """
+        if self.method == "average":
+            return self._sell_average(quantity, date)
+
+        remaining = quantity
+        while remaining > QUANTITY_EPSILON and self.head < len(self.quantities):
+            index = self.head if self.method == "fifo" else len(self.quantities) - 1
+            held = self.quantities[index]
+            sold = min(held, remaining)
+            self.closed.append((sold, self.costs[index], self.starts[index], date))
+            remaining -= sold
+            if held - sold > QUANTITY_EPSILON:
+                self.quantities[index] = held - sold
+            elif self.method == "fifo":
+                self.head += 1
+            else:
+                self.quantities.pop()
+                self.costs.pop()
+                self.starts.pop()
+        self._compact()
+        return remaining if remaining > QUANTITY_EPSILON else 0.0
+
+    def _compact(self):
+        if self.head >= COMPACT_MIN_HEAD and self.head * 2 >= len(self.quantities):
+            del self.quantities[: self.head]
+            del self.costs[: self.head]
+            del self.starts[: self.head]
+            self.head = 0
+
+    # The pool lives in slot 0: (quantity, average cost, start of the segment)
+    def _close_segment(self, end):
+        if self.quantities and self.starts[0] <= end:
+            self.closed.append((self.quantities[0], self.costs[0], self.starts[0], end))
+
+    def _buy_average(self, quantity, cost_per_unit, date):
+        if not self.quantities:
+            self.quantities.append(quantity)
+            self.costs.append(cost_per_unit)
+            self.starts.append(date)
+            return
+        pooled = self.quantities[0]
+        if self.starts[0] > date:
+            # Sold earlier today: the day is closed, count these shares separately
+            self.closed.append((quantity, cost_per_unit, date, date))
+        else:
+            self._close_segment(date - timedelta(days=1))
+            self.starts[0] = date
+        total = pooled + quantity
+        self.costs[0] = (pooled * self.costs[0] + quantity * cost_per_unit) / total
+        self.quantities[0] = total
+
+    def _sell_average(self, quantity, date):
+        if not self.quantities:
+            return quantity
+        self._close_segment(date)
+        pooled = self.quantities[0]
+        sold = min(pooled, quantity)
+        if pooled - sold > QUANTITY_EPSILON:
+            self.quantities[0] = pooled - sold
+            self.starts[0] = max(self.starts[0], date + timedelta(days=1))
+        else:
+            self.quantities.clear()
+            self.costs.clear()
+            self.starts.clear()
+        remaining = quantity - sold
+        return remaining if remaining > QUANTITY_EPSILON else 0.0
+
+    def lots(self):
+        """
+        Returns the closed and open lots as position dicts (end_date None while
+        open).
+        """
+        lots = [
+            {
+                "currency": self.currency,
+                "quantity": quantity,
+                "cost_per_unit": cost_per_unit,
+                "start_date": start,
+                "end_date": end,
+            }
+            for quantity, cost_per_unit, start, end in self.closed
+        ]
+        for index in range(self.head, len(self.quantities)):
+            lots.append(
+                {
+                    "currency": self.currency,
+                    "quantity": self.quantities[index],
+                    "cost_per_unit": self.costs[index],
+                    "start_date": self.starts[index],
+                    "end_date": None,
+                }
+            )
+        return lots
@@ -1,29 +1,119 @@
-from fastapi import FastAPI, File, UploadFile
-from fastapi.responses import JSONResponse
+import asyncio
+from contextlib import asynccontextmanager
+from typing import Literal
+from fastapi import FastAPI, File, HTTPException, Query, Request, UploadFile
+from fastapi.responses import PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
-import pandas as pd
-import io
-from process_data import calculate_metrics_async
-from db import create_tables
+from process_data import TIME_SERIES_FORMATS, calculate_metrics_async
+from db import DB_PATH, init_db, close_connections
+from workers import run_blocking, shutdown_executor
+from http_client import start_http_client, close_http_client
+from cache_store import flush_cache_stores
+from result_cache import upload_cache_key, upload_results
+from ingestion import hash_upload, read_account_csv, read_portfolio_csv
+from responses import encode_json, json_response
+from instrumentation import (
+    PROFILING_ENABLED,
+    PROFILE_MAX_SECONDS,
+    metrics_snapshot,
+    sample_profile,
+    server_timing,
+    span,
+    start_request,
+)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await start_http_client()
+    # Create or migrate the schema once, not on every upload
+    await run_blocking(init_db, DB_PATH)
+    yield
+    await close_http_client()
+    flush_cache_stores()
+    shutdown_executor()
+    close_connections()
 
-app = FastAPI()
+
+app = FastAPI(lifespan=lifespan)
 
 
 @app.post("/upload")
 async def upload_files(
-    account: UploadFile = File(...), portfolio: UploadFile = File(...)
+    request: Request,
+    account: UploadFile = File(...),
+    portfolio: UploadFile = File(...),
+    # "columnar" returns the daily series as one shared dates array
+    time_series_format: Literal[TIME_SERIES_FORMATS] = Query("records", alias="format"),
 ):
-    # Read files into dataframes
-    account_df = pd.read_csv(io.BytesIO(await account.read()))
-    portfolio_df = pd.read_csv(io.BytesIO(await portfolio.read()))
+    timings = start_request()
+    with span("total"):
+        response = await _upload_response(
+            account, portfolio, time_series_format, request
+        )
+    response.headers["Server-Timing"] = server_timing(timings)
+    return response
+
 
-    # Start db
-    create_tables("stocks.db")
+async def _upload_response(account, portfolio, time_series_format, request):
+    # The uploads are spooled to temporary files: hash them in chunks. The
+    # response layout is part of the cache key too.
+    with span("cache"):
+        key_parts = [
+            await hash_upload(account),
+            await hash_upload(portfolio),
+            time_series_format,
+        ]
+
+        # Identical files against the same market data give the same metrics
+        cache_key = await run_blocking(upload_cache_key, key_parts, DB_PATH)
+        body = upload_results.get(cache_key)
+    accept_encoding = request.headers.get("accept-encoding", "")
+    if body is not None:
+        with span("serialize"):
+            return await run_blocking(
+                json_response, body, accept_encoding, {"X-Cache": "HIT"}
+            )
+
+    # Read files into dataframes
+    with span("parse"):
+        account_df, _, stats = await run_blocking(read_account_csv, account.file)
+        print(f"Read account export: {stats.summary()}")
+        portfolio_df, _ = await run_blocking(read_portfolio_csv, portfolio.file)
 
     # Call the calculation function
-    metrics = await calculate_metrics_async(account_df, portfolio_df)
+    metrics = await calculate_metrics_async(
+        account_df, portfolio_df, time_series_format
+    )
+    # The calculation may have refreshed market data, so key on the new version
+    cache_key = await run_blocking(upload_cache_key, key_parts, DB_PATH)
+    with span("serialize"):
+        body = await run_blocking(encode_json, metrics)
+        response = await run_blocking(
+            json_response, body, accept_encoding, {"X-Cache": "MISS"}
+        )
+    upload_results.put(cache_key, body)
+    return response
+
+
+@app.get("/metrics")
+async def metrics():
+    """
+    Counters and per-stage timing aggregates of this process.
+    """
+    return json_response(encode_json(metrics_snapshot()))
+
 
-    return JSONResponse(content=metrics)
+@app.get("/debug/profile")
+async def profile(seconds: float = Query(5.0, gt=0, le=PROFILE_MAX_SECONDS)):
+    """
+    Samples the stacks of the process for `seconds` and returns them collapsed.
+    Only available with PROFILING_ENABLED=1.
+    """
+    if not PROFILING_ENABLED:
+        raise HTTPException(status_code=404)
+    # Sample from a thread of its own, so the blocking pool stays available
+    return PlainTextResponse(await asyncio.to_thread(sample_profile, seconds))
 
 
 app.add_middleware(
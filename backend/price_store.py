@@ -0,0 +1,130 @@
+import os
+import threading
+import urllib.parse
+
+import numpy as np
+
+# Directory of the columnar price store, empty to read closes from SQLite only
+PRICE_STORE_DIR = os.environ.get("PRICE_STORE_DIR", "")
+
+# One record per trading day: the day as days since 1970-01-01 and the close
+PRICE_DTYPE = np.dtype([("day", "<i4"), ("close", "<f8")])
+
+
+def to_days(dates):
+    """
+    Converts 'YYYY-MM-DD' strings or datetime64 values to int32 day ordinals.
+    """
+    return np.asarray(dates, dtype="datetime64[D]").astype(np.int32)
+
+
+class PriceStore:
+    """
+    Daily closes kept as one memory-mapped .npy file per ticker, sorted by day,
+    mirroring the Date/Close columns of the stock_data table.
+
+    Reads slice the mapped file without copying. Updates write the extended
+    series to a temporary file and swap it in, so readers never see a partial
+    file and a mapped old version stays valid until it is dropped.
+    """
+
+    def __init__(self, directory=PRICE_STORE_DIR):
+        self.directory = directory
+        self._mapped = {}  # ticker -> (file signature, mapped array)
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, ticker):
+        return os.path.join(
+            self.directory, urllib.parse.quote(ticker, safe="") + ".npy"
+        )
+
+    def read(self, ticker):
+        """
+        Returns the mapped (day, close) records of `ticker`, or None if the
+        store has no file for it.
+        """
+        path = self.path(ticker)
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return None
+        signature = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            mapped = self._mapped.get(ticker)
+            if mapped is None or mapped[0] != signature:
+                records = np.load(path, mmap_mode="r")
+                mapped = self._mapped[ticker] = (signature, records)
+        return mapped[1]
+
+    def slice(self, ticker, start, end):
+        """
+        Returns views of the days and closes of `ticker` between `start` and
+        `end` ('YYYY-MM-DD', inclusive), or None if the ticker is not stored.
+        """
+        records = self.read(ticker)
+        if records is None:
+            return None
+        days = records["day"]
+        low = np.searchsorted(days, to_days(start))
+        high = np.searchsorted(days, to_days(end), side="right")
+        return days[low:high], records["close"][low:high]
+
+    def append(self, ticker, days, closes):
+        """
+        Adds the closes of days after the last stored one to `ticker`.
+        """
+        records = self.read(ticker)
+        new = np.empty(len(days), dtype=PRICE_DTYPE)
+        new["day"] = days
+        new["close"] = closes
+        if records is not None and len(records):
+            new = np.concatenate([records, new[new["day"] > records[-1][0]]])
+
+        path = self.path(ticker)
+        temporary = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temporary, "wb") as f:
+            np.save(f, new)
+        os.replace(temporary, path)
+
+    def sync(self, conn, tickers):
+        """
+        Appends the stock_data rows of `tickers` newer than their stored
+        series, backfilling tickers the store does not have yet. Returns the
+        number of closes added.
+        """
+        added = 0
+        for ticker in tickers:
+            records = self.read(ticker)
+            since = ""
+            if records is not None and len(records):
+                since = str(np.datetime64(int(records[-1][0]), "D"))
+            rows = conn.execute(
+                """
+                SELECT Date, Close FROM stock_data
+                WHERE Ticker = ? AND Date > ? ORDER BY Date
+            """,
+                (ticker, since),
+            ).fetchall()
+            if rows or records is None:
+                dates, closes = zip(*rows) if rows else ((), ())
+                self.append(ticker, to_days(dates), np.array(closes, dtype="f8"))
+                added += len(rows)
+        return added
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_price_store(directory=PRICE_STORE_DIR):
+    """
+    Returns the process-wide price store of `directory`, or None when the
+    columnar store is disabled (no directory configured).
+    """
+    if not directory:
+        return None
+    with _stores_lock:
+        if directory not in _stores:
+            _stores[directory] = PriceStore(directory)
+        return _stores[directory]
@@ -1,443 +1,411 @@
+import re
+import numpy as np
 import pandas as pd
-from ticker_service import get_processed_tickers, get_ticker_symbol
+from ticker_service import resolve_tickers
 from stock_service import update_stock_data_table, calculate_total_daily_profit_loss
-import cProfile
-import pstats
-import io
-from datetime import datetime
-import holidays
-
-DEBUG = True
-
-
-def clean_currency(value):
-    """Convert currency strings to numeric values."""
-    if isinstance(value, str):
-        value = value.replace("USD", "").replace("EUR", "").replace(",", "").strip()
-        try:
-            return float(value) if value else 0
-        except ValueError:
-            print(f"Unable to convert value: {value}")
-            return 0
-    return float(value)
-
-
-def parse_transaction_description(description, currency, tipo):
-    # Example description: "Compra 2 Visa Inc@278,5 USD"
-    description_parts = description.split("@")
-    quantity = float(description_parts[0].split()[1])
-    price = float(
-        description_parts[1]
-        .split()[0]
-        .replace(".", "")
-        .replace(",", ".")
-        .split("@")[-1]
-    )
-    if currency == "USD":
-        price = price / tipo  # Convert USD to EUR
-    return quantity, price
+from workers import run_blocking
+from transactions import parse_transactions, malformed_transactions
+from lots import LotBook, LOT_METHOD
+from amounts import ACCOUNT_NUMERIC_COLUMNS, parse_numbers
+from trading_calendar import exchange_for_ticker, is_trading_day
+from instrumentation import span
+
+# Descriptions of fee rows, and the keywords of each fee category (first match wins)
+FEE_PATTERN = "comisión|impuesto|tarifa|coste|fee|connection|FTT"
+FEE_CATEGORIES = {
+    "Transaction Fees": ["transaction", "coste"],
+    "Exchange Fees": ["connection", "exchange", "conectividad"],
+    "FTT Fees": ["impuesto", "FTT", "financial transaction tax"],
+    "ADR/GDR Fees": ["ADR", "GDR", "pass-through"],
+}
+
+
+def build_positions(df, method=LOT_METHOD):
+    """
+    Builds the lots held for each product from the account transactions, matching
+    sales by `method` ("fifo", "lifo" or "average", see lots.LotBook).
+    """
+    parsed = parse_transactions(df)
+    malformed = malformed_transactions(parsed)
+    if not malformed.empty:
+        print(f"Warning: skipping {len(malformed)} malformed transactions")
+        for row in malformed.itertuples():
+            print(f"  {row.description!r}: {row.error}")
+    trades = parsed[parsed["side"].notna() & parsed["error"].isna()]
+
+    # Match the sales against the lots held of each product
+    books = {}
+    for product, side, currency, quantity, price, date in zip(
+        trades["product"],
+        trades["side"],
+        trades["currency"],
+        trades["quantity"].tolist(),
+        trades["price_eur"].tolist(),
+        # LotBook needs datetimes, Series.dt.to_pydatetime warns on pandas 2.2
+        pd.DatetimeIndex(trades["date"]).to_pydatetime(),
+    ):
+        if side == "buy":
+            if product not in books:
+                books[product] = LotBook(currency, method)
+            books[product].buy(quantity, price, date)
+
+        elif side == "sell":
+            book = books.get(product)
+            if book is None or book.sell(quantity, date):
+                print(f"Warning: sold more {product} on {date:%Y-%m-%d} than held")
+
+    return {product: book.lots() for product, book in books.items()}
 
 
 async def calculate_profits_async(df):
-    df = df[~df["ID Orden"].isna()]
-    df = df[["Fecha", "Producto", "Descripción", "Tipo", "Variación", "Saldo"]]
-    df_eur = df[df["Variación"] == "EUR"]
-    df_usd = df[df["Variación"] == "USD"].copy()
-    df_usd.loc[:, "Tipo"] = df_usd["Tipo"].ffill()
-    df = pd.concat([df_eur, df_usd])
-
-    # Initialize positions dictionary to track stocks and their purchase data
-    positions = {}
-
-    # Iterate over transactions to build positions and get tickers
-    for _, row in df[::-1].iterrows():
-        product = row["Producto"]
-        description = row["Descripción"]
-        currency = row["Variación"]
-        date = datetime.strptime(row["Fecha"], "%d-%m-%Y")
-
-        if "Compra" in description:
-            # Buying shares
-            quantity, price = parse_transaction_description(
-                description, currency, row["Tipo"]
-            )
-            if product not in positions:
-                positions[product] = []
-            positions[product].append(
-                {
-                    "currency": currency,
-                    "quantity": quantity,
-                    "cost_per_unit": price,
-                    "start_date": date,
-                    "end_date": None,
-                }
-            )
+    with span("positions"):
+        positions = await run_blocking(build_positions, df)
 
-        elif "Venta" in description:
-            # Selling shares
-            quantity, price = parse_transaction_description(
-                description, currency, row["Tipo"]
-            )
-            if product in positions:
-                lot_num = 0
-                remaining_quantity = quantity
-                while remaining_quantity > 0:
-                    lot = positions[product][lot_num]
-                    if lot["quantity"] <= remaining_quantity:
-                        remaining_quantity -= lot["quantity"]
-                        lot["end_date"] = date
-                        # positions[product].pop(0)
-                    else:
-                        lot["quantity"] -= remaining_quantity
-                        lot["end_date"] = date
-                        remaining_quantity = 0
-                    lot_num += 1
-    # Get already processed tickers
-    products_to_fetch = get_processed_tickers(positions.keys())
-
-    # Get tickers for products that are not already processed
-    for product, value in products_to_fetch.items():
-        if value == "NA":
-            products_to_fetch[product] = await get_ticker_symbol(
-                product.lower()
-                .replace("adr on ", "")
-                .replace("class c", "")
-                .replace("class a", "")
-                .replace("class b", "")
-                .replace(".com", "")
-                .strip()
-            )
+    # Resolve all tickers at once, searching the unknown products concurrently
+    with span("tickers"):
+        products_to_fetch = await resolve_tickers(positions.keys())
 
     # Update stock data table with new data
-    update_stock_data_table(products_to_fetch.values())
+    with span("market_data"):
+        await run_blocking(update_stock_data_table, list(products_to_fetch.values()))
 
     # daily_profits = calculate_daily_profit_loss(positions, products_to_fetch)
     # Get overall daily profit/loss
-    overall_daily_profits = calculate_total_daily_profit_loss(
-        positions, products_to_fetch
-    )
+    with span("pnl"):
+        dates, values = await run_blocking(
+            calculate_total_daily_profit_loss, positions, products_to_fetch
+        )
 
-    us_holidays = holidays.US(years=range(2010, 2030))
-    filtered_data = {
-        date: round(value, 2)
-        for date, value in overall_daily_profits.items()
-        if date.weekday() < 5  # Exclude weekends
-        and date not in us_holidays  # Exclude US public holidays
+    # Keep the days on which at least one of the holdings' exchanges is open
+    exchanges = {
+        exchange_for_ticker(ticker) for ticker in products_to_fetch.values() if ticker
     }
+    trading = is_trading_day(dates, exchanges or {"US"})
 
-    filtered_data = pd.DataFrame(list(filtered_data.items()), columns=["date", "value"])
-
-    return filtered_data
+    return pd.DataFrame({"date": dates[trading], "value": values[trading].round(2)})
 
 
-async def calculate_metrics_async(
-    account_df: pd.DataFrame,
-    portfolio_df: pd.DataFrame,
-) -> dict:
-    if DEBUG:
-        profiler = cProfile.Profile()
-        profiler.enable()
-
+def prepare_account_df(account_df):
+    """
+    Normalizes the description and amount columns of the account export in place.
+    """
     # Prepare necessary columns
-    amount_column = "Unnamed: 8"  # Column containing amounts
     description_column = "Descripción"
 
     # Ensure description column values are strings for proper filtering
     account_df[description_column] = account_df[description_column].astype(str)
-    account_df[amount_column] = account_df[amount_column].apply(clean_currency)
-
-    total_dividends_received = 0
-
-    # Filter rows by 'Descripción' and 'ID Orden'
-    filtered_df = account_df[
-        account_df["Descripción"].isin(
-            [
-                "Ingreso Cambio de Divisa",
-                "Retirada Cambio de Divisa",
-                "Dividendo",
-                "Retención del dividendo",
-            ]
-        )
-        & account_df["ID Orden"].isna()
-    ]
 
-    # Filter for relevant descriptions: Dividendo, Retención del dividendo, Retirada Cambio de Divisa
-    relevant_descriptions = [
-        "Dividendo",
-        "Retención del dividendo",
-        "Retirada Cambio de Divisa",
-    ]
-    relevant_df = filtered_df[
-        filtered_df["Descripción"].isin(relevant_descriptions)
-    ].copy()
-
-    relevant_df_eur = relevant_df[relevant_df["Saldo"] == "EUR"]
-    relevant_df_eur = relevant_df_eur[~relevant_df_eur["Producto"].isna()]
+    # Amounts are already numbers when read with amounts.read_account_csv
+    for column in ACCOUNT_NUMERIC_COLUMNS:
+        if column in account_df.columns:
+            account_df[column] = parse_numbers(account_df[column])[0]
 
-    relevant_df_usd = relevant_df[relevant_df["Saldo"] == "USD"].copy()
-    relevant_df_usd.loc[:, "Tipo"] = relevant_df_usd["Tipo"].ffill()
 
-    # Create a new DataFrame to store the calculated results
-    result_df = []
+DIVIDEND_KEYS = ["Fecha valor", "Producto"]
 
-    # Process EUR dividends
-    euro_groups = relevant_df_eur.groupby(["Fecha valor", "Producto"])
-    for group_id, group in euro_groups:
-        dividend_row = group[group["Descripción"] == "Dividendo"]
-        retention_row = group[group["Descripción"] == "Retención del dividendo"]
 
-        # Skip if the dividend row is empty
-        if dividend_row.empty:
-            continue
+def dividend_events(account_df):
+    """
+    Returns the dividends as one row per (Fecha valor, Producto) payment, with
+    the gross dividend, the retention and the net dividend in EUR.
 
-        # Extract values for calculation
-        dividend_amount = (
-            float(dividend_row[amount_column].iloc[0]) if not dividend_row.empty else 0
-        )
-        retention_amount = (
-            abs(float(retention_row[amount_column].iloc[0]))
-            if not retention_row.empty
-            else 0
-        )
+    Each payment takes the first dividend, retention and (for USD) currency
+    conversion row of its date and product; payments without a dividend row are
+    skipped. USD dividends are converted with the Tipo of the conversion row.
+    """
+    amount_column = "Unnamed: 8"  # Column containing amounts
 
-        # Calculate the net dividend
-        net_dividend = dividend_amount - retention_amount
-
-        # Store the result
-        result_df.append(
-            {
-                "Product": dividend_row["Producto"].iloc[0],
-                "Gross Dividend": dividend_amount,
-                "Retention": retention_amount,
-                "Net Dividend": net_dividend,
-                "Currency": "EUR",
-            }
+    relevant_df = account_df[
+        account_df["Descripción"].isin(
+            ["Dividendo", "Retención del dividendo", "Retirada Cambio de Divisa"]
         )
+        & account_df["ID Orden"].isna()
+    ]
 
-    # Process USD dividends
-    usd_groups = relevant_df_usd.groupby(["Fecha valor", "Producto"])
-    for group_id, group in usd_groups:
-        dividend_row = group[group["Descripción"] == "Dividendo"]
-        retention_row = group[group["Descripción"] == "Retención del dividendo"]
-        conversion_row = group[group["Descripción"] == "Retirada Cambio de Divisa"]
-
-        # Skip if the dividend row is empty
-        if dividend_row.empty:
+    events = []
+    for currency in ("EUR", "USD"):
+        rows = relevant_df[relevant_df["Saldo"] == currency].copy()
+        if currency == "USD":
+            rows["Tipo"] = rows["Tipo"].ffill()
+        rows = rows[rows["Fecha valor"].notna() & rows["Producto"].notna()]
+        rows = rows.drop_duplicates(DIVIDEND_KEYS + ["Descripción"])
+        by_description = {
+            description: group.set_index(DIVIDEND_KEYS)
+            for description, group in rows.groupby("Descripción")
+        }
+        if "Dividendo" not in by_description:
             continue
 
-        # Extract values for calculation
-        dividend_amount = (
-            float(dividend_row[amount_column].iloc[0]) if not dividend_row.empty else 0
-        )
-        retention_amount = (
-            abs(float(retention_row[amount_column].iloc[0]))
-            if not retention_row.empty
-            else 0
-        )
-        conversion_rate = (
-            float(conversion_row["Tipo"].iloc[0]) if not conversion_row.empty else 1
-        )
+        gross = by_description["Dividendo"][amount_column].astype(float).sort_index()
+        retention = pd.Series(0.0, index=gross.index)
+        if "Retención del dividendo" in by_description:
+            retention = (
+                by_description["Retención del dividendo"][amount_column]
+                .astype(float)
+                .abs()
+                .reindex(gross.index, fill_value=0.0)
+            )
+        net = gross - retention
+        if currency == "USD" and "Retirada Cambio de Divisa" in by_description:
+            rate = (
+                by_description["Retirada Cambio de Divisa"]["Tipo"]
+                .astype(float)
+                .reindex(gross.index, fill_value=1.0)
+            )
+            net = net * rate
 
-        # Calculate the net dividend and convert to EUR
-        net_dividend = (dividend_amount - retention_amount) * conversion_rate
-
-        # Store the result
-        result_df.append(
-            {
-                "Product": dividend_row["Producto"].iloc[0],
-                "Gross Dividend": dividend_amount,
-                "Retention": retention_amount,
-                "Net Dividend": net_dividend,
-                "Currency": "EUR",
-            }
+        events.append(
+            pd.DataFrame(
+                {
+                    "Gross Dividend": gross,
+                    "Retention": retention,
+                    "Net Dividend": net,
+                    "Currency": currency,
+                }
+            )
         )
 
-    # Convert the result to a DataFrame
-    result_df = pd.DataFrame(result_df)
-
-    # Calculate the total dividends in EUR
-    total_dividends_received = result_df["Net Dividend"].sum()
-
-    # Step 2: Total Fees (Commissions, Taxes, etc.) Calculation with breakdown by type
-    fees = account_df[
-        account_df[description_column].str.contains(
-            "comisión|impuesto|tarifa|coste|fee|connection|FTT", case=False, na=False
+    if not events:
+        return pd.DataFrame(
+            columns=["Gross Dividend", "Retention", "Net Dividend", "Currency"],
+            index=pd.MultiIndex.from_tuples([], names=DIVIDEND_KEYS),
         )
-    ]
-    fees = fees.copy()
-    fees[amount_column] = fees[amount_column].apply(clean_currency)
-
-    # Categorize fees
-    fee_categories = {
-        "Transaction Fees": ["transaction", "coste"],
-        "Exchange Fees": ["connection", "exchange", "conectividad"],
-        "FTT Fees": ["impuesto", "FTT", "financial transaction tax"],
-        "ADR/GDR Fees": ["ADR", "GDR", "pass-through"],
+    return pd.concat(events)
+
+
+def calculate_dividends(account_df):
+    """
+    Returns the total net dividends received and the net dividends per product,
+    in EUR.
+    """
+    events = dividend_events(account_df)
+    total_dividends_received = events["Net Dividend"].sum()
+    by_product = events.groupby(level="Producto", observed=True)["Net Dividend"].sum()
+    dividend_breakdown = {
+        product: round(value, 2) for product, value in by_product.items()
     }
+    return total_dividends_received, dividend_breakdown
 
-    fee_summary = {key: 0 for key in fee_categories}
 
-    # Categorize and sum the fees
-    for idx, row in fees.iterrows():
-        for category, keywords in fee_categories.items():
-            if any(
-                keyword.lower() in row[description_column].lower()
-                for keyword in keywords
-            ):
-                fee_summary[category] += row[amount_column]
-                break
+def classify_fees(account_df, categories=FEE_CATEGORIES):
+    """
+    Returns the fee rows of the account export with their amount, date and
+    category: the first of `categories` with a keyword in the description, or
+    None. Each distinct description is lowercased and matched once, with one
+    compiled alternation per category.
+    """
+    amount_column = "Unnamed: 8"  # Column containing amounts
+    # A missing description would get code -1, the flags of the last description
+    codes, descriptions = pd.factorize(account_df["Descripción"].fillna("").astype(str))
+    descriptions = pd.Series(descriptions, dtype=object).str.lower()
+
+    is_fee = descriptions.str.contains(FEE_PATTERN.lower()).to_numpy(bool)
+    matches = [
+        descriptions.str.contains(
+            "|".join(re.escape(keyword.lower()) for keyword in keywords)
+        ).to_numpy(bool)
+        for keywords in categories.values()
+    ]
+    category = np.select(matches, list(categories), None) if matches else None
+    category = np.broadcast_to(np.array(category, dtype=object), is_fee.shape)
+
+    rows = is_fee[codes]
+    return pd.DataFrame(
+        {
+            "date": pd.to_datetime(
+                account_df.loc[rows, "Fecha"], format="%d-%m-%Y", errors="coerce"
+            ),
+            "amount": account_df.loc[rows, amount_column].astype(float),
+            "category": category[codes[rows]],
+        },
+        index=account_df.index[rows],
+    )
 
-    # Round fee summary values to 2 decimals
-    fee_summary = {key: round(value, 2) for key, value in fee_summary.items()}
-    total_fees = round(fees[amount_column].sum(), 2)
 
-    # Step 3: Profit/Loss Calculation for Each Company Using Account Data
-    # profit_loss, profit_loss_breakdown = await calculate_profits_async(account_df)
-    historical_portfolio_value = await calculate_profits_async(account_df)
-    profit_loss = round(float(historical_portfolio_value["value"].iloc[-1]), 2)
+def calculate_fees(account_df, categories=FEE_CATEGORIES):
+    """
+    Returns the fee breakdown by category, the total fees and the fees per month
+    and category.
+    """
+    fees = classify_fees(account_df, categories)
 
-    # Step 4: Portfolio Balance and Cash Calculation using
-    portfolio_df["Valor en EUR"] = pd.to_numeric(
-        portfolio_df["Valor en EUR"].str.replace(",", "."), errors="coerce"
+    totals = fees.groupby("category")["amount"].sum()
+    fee_summary = {key: round(totals.get(key, 0), 2) for key in categories}
+    total_fees = round(fees["amount"].sum(), 2)
+
+    month = pd.Series(
+        fees["date"].to_numpy("datetime64[M]"), index=fees.index, name="month"
     )
+    monthly = (
+        fees.pivot_table(
+            index=month,
+            columns=fees["category"].fillna("Other Fees"),
+            values="amount",
+            aggfunc="sum",
+        )
+        .reindex(columns=[*categories, "Other Fees"])
+        .fillna(0.0)
+    )
+    monthly["Total"] = monthly.sum(axis=1)
+    monthly = monthly.round(2)
+    monthly.index = monthly.index.strftime("%Y-%m")
+    monthly_fees = monthly.reset_index().to_dict(orient="records")
+    return fee_summary, total_fees, monthly_fees
+
+
+def calculate_portfolio_balance(portfolio_df):
+    """
+    Returns the portfolio value without cash and the cash balance.
+    """
+    portfolio_df["Valor en EUR"] = parse_numbers(portfolio_df["Valor en EUR"])[0]
     cash = portfolio_df[
         portfolio_df["Producto"].str.contains("cash", case=False, na=False)
     ]["Valor en EUR"].sum()
     portfolio_value = round(portfolio_df["Valor en EUR"].sum() - cash, 2)
+    return portfolio_value, cash
 
-    # Step 5: Returns
-    account_df = account_df[account_df["Fecha"].notna()]
 
-    # Calculate cumulative cash flow over time
-    cashflow_df = account_df[
-        account_df["Descripción"].str.contains(
+def build_time_series(account_df, historical_portfolio_value):
+    """
+    Aligns the cumulative cashflow and the portfolio profit/loss on one daily
+    DatetimeIndex. Returns a DataFrame with "cashflow", "portfolio_value" and
+    their sum "value", rounded to cents.
+    """
+    amount_column = "Unnamed: 8"  # Column containing amounts
+
+    # Deposits, oldest first; only EUR amounts count towards the cashflow
+    deposits = account_df[
+        account_df["Fecha"].notna()
+        & account_df["Descripción"].str.contains(
             "flatex Deposit|Flatex Instant Deposit|Ingreso Sofort/Trustly",
             case=False,
             na=False,
         )
-    ]
-
-    cumulative_cashflow = cashflow_df[cashflow_df["Variación"] == "EUR"][amount_column][
-        ::-1
-    ].cumsum()
-    historical_cashflow = pd.DataFrame(
-        {"date": cashflow_df["Fecha"][::-1], "value": cumulative_cashflow}
+    ][::-1]
+    cumulative_cashflow = (
+        deposits[amount_column].where(deposits["Variación"] == "EUR").cumsum()
+    )
+    cashflow = pd.Series(
+        cumulative_cashflow.to_numpy(dtype="float64"),
+        index=pd.to_datetime(deposits["Fecha"], format="%d-%m-%Y"),
     ).ffill()
-
-    # cumulative_cashflow = 0
-    # for _, row in account_df[::-1].iterrows():
-    #     try:
-    #         if row['Variación'] == 'EUR':
-    #             cumulative_cashflow += row['Unnamed: 8']
-    #         historical_cashflow.append({
-    #             'date': row['Fecha'],
-    #             'value': cumulative_cashflow
-    #         })
-    #     except Exception as e:
-    #         print(f"Unable to parse date: {row['Fecha']}, error: {e}")
-    #
-    # historical_cashflow = pd.DataFrame(historical_cashflow)
-    historical_cashflow["value"] = historical_cashflow["value"].round(2)
-
-    historical_portfolio_value["date"] = historical_portfolio_value["date"].dt.strftime(
-        "%Y-%m-%d"
+    portfolio_value = pd.Series(
+        historical_portfolio_value["value"].to_numpy(dtype="float64"),
+        index=pd.DatetimeIndex(historical_portfolio_value["date"]),
     )
 
-    # Convert 'date' column to datetime format
-    historical_cashflow["date"] = pd.to_datetime(
-        historical_cashflow["date"], format="%d-%m-%Y"
-    )
-    # Remove duplicate dates by keeping the last occurrence
-    historical_cashflow = historical_cashflow.drop_duplicates(
-        subset="date", keep="last"
-    )
-    # Create a complete date range and reindex the DataFrame to fill missing dates
-    all_dates = pd.date_range(
-        historical_cashflow["date"].min(),
-        historical_portfolio_value["date"].max(),
-        freq="D",
-    )
-    historical_cashflow = (
-        historical_cashflow.set_index("date")
-        .reindex(all_dates)
-        .ffill()
-        .bfill()
-        .reset_index()
+    # The last value of each day, on a daily index from the first deposit to the
+    # last portfolio valuation
+    cashflow = cashflow[~cashflow.index.duplicated(keep="last")].sort_index()
+    portfolio_value = portfolio_value[
+        ~portfolio_value.index.duplicated(keep="last")
+    ].sort_index()
+    dates = pd.date_range(cashflow.index.min(), portfolio_value.index.max(), freq="D")
+    portfolio_value = portfolio_value[portfolio_value.index >= cashflow.index.min()]
+
+    series = pd.DataFrame(
+        {
+            "cashflow": cashflow.round(2).reindex(dates, method="ffill"),
+            "portfolio_value": portfolio_value.reindex(dates, method="ffill"),
+        },
+        index=dates,
+    ).bfill()
+    series["value"] = series["cashflow"] + series["portfolio_value"]
+    return series.round(2)
+
+
+def time_series_records(series):
+    """
+    Returns the historical_portfolio_value, historical_cashflow and
+    combined_data lists of {"date", "value"} records of a build_time_series
+    frame.
+    """
+    dates = series.index.strftime("%Y-%m-%d").tolist()
+    return tuple(
+        [
+            {"date": date, "value": value}
+            for date, value in zip(dates, series[column].tolist())
+        ]
+        for column in ("portfolio_value", "cashflow", "value")
     )
-    historical_cashflow.columns = ["date", "value"]
-    # convert date in string Year Month Day format
-    historical_cashflow["date"] = historical_cashflow["date"].dt.strftime("%Y-%m-%d")
 
-    historical_portfolio_value["date"] = pd.to_datetime(
-        historical_portfolio_value["date"], format="%Y-%m-%d"
-    )
-    historical_portfolio_value = historical_portfolio_value.drop_duplicates(
-        subset="date", keep="last"
-    )
-    historical_portfolio_value = (
-        historical_portfolio_value.set_index("date")
-        .reindex(all_dates)
-        .ffill()
-        .bfill()
-        .reset_index()
-        .rename(columns={"index": "date"})
-    )
-    historical_portfolio_value["date"] = historical_portfolio_value["date"].dt.strftime(
-        "%Y-%m-%d"
-    )
 
-    # Merge DataFrames on 'date'
-    merged_df = pd.merge(
-        historical_cashflow, historical_portfolio_value, on="date", how="right"
-    ).ffill()
-    merged_df.rename(
-        columns={"value_x": "cashflow_value", "value_y": "portfolio_value"},
-        inplace=True,
-    )
+def time_series_columns(series):
+    """
+    Returns a build_time_series frame as one dates array shared by the value
+    arrays, which stay float64 NumPy arrays for the encoder.
+    """
+    return {
+        "dates": series.index.strftime("%Y-%m-%d").tolist(),
+        "portfolio_value": series["portfolio_value"].to_numpy(copy=True),
+        "cashflow": series["cashflow"].to_numpy(copy=True),
+        "value": series["value"].to_numpy(copy=True),
+    }
 
-    # Sum the 'value' fields
-    merged_df["value"] = merged_df["cashflow_value"] + merged_df["portfolio_value"]
 
-    combined_data = merged_df[["date", "value"]].copy()
+# Layouts of the daily series in the metrics: "records" repeats the dates in
+# three lists of {"date", "value"}, "columnar" shares one dates array
+TIME_SERIES_FORMATS = ("records", "columnar")
 
-    combined_data["value"] = pd.to_numeric(combined_data["value"], errors="coerce")
-    combined_data["value"] = combined_data["value"].round(2)
-    historical_portfolio_value["value"] = pd.to_numeric(
-        historical_portfolio_value["value"], errors="coerce"
-    )
-    historical_portfolio_value["value"] = historical_portfolio_value["value"].round(2)
-    historical_cashflow["value"] = pd.to_numeric(
-        historical_cashflow["value"], errors="coerce"
+
+async def calculate_metrics_async(
+    account_df: pd.DataFrame,
+    portfolio_df: pd.DataFrame,
+    time_series_format: str = "records",
+) -> dict:
+    await run_blocking(prepare_account_df, account_df)
+    with span("dividends"):
+        total_dividends_received, dividend_breakdown = await run_blocking(
+            calculate_dividends, account_df
+        )
+
+    # Step 2: Total Fees (Commissions, Taxes, etc.) Calculation with breakdown by type
+    with span("fees"):
+        fee_summary, total_fees, monthly_fees = await run_blocking(
+            calculate_fees, account_df
+        )
+
+    # Step 3: Profit/Loss Calculation for Each Company Using Account Data
+    # profit_loss, profit_loss_breakdown = await calculate_profits_async(account_df)
+    historical_portfolio_value = await calculate_profits_async(account_df)
+    profit_loss = round(float(historical_portfolio_value["value"].iloc[-1]), 2)
+
+    # Step 4: Portfolio Balance and Cash Calculation using
+    portfolio_value, cash = await run_blocking(
+        calculate_portfolio_balance, portfolio_df
     )
-    historical_cashflow["value"] = historical_cashflow["value"].round(2)
 
-    combined_data = combined_data.to_dict(orient="records")
-    historical_portfolio_value = historical_portfolio_value.to_dict(orient="records")
-    historical_cashflow = historical_cashflow.to_dict(orient="records")
+    # Step 5: Returns
+    with span("series"):
+        series = await run_blocking(
+            build_time_series, account_df, historical_portfolio_value
+        )
+        if time_series_format == "columnar":
+            time_series = {"time_series": time_series_columns(series)}
+        else:
+            historical_portfolio_value, historical_cashflow, combined_data = (
+                time_series_records(series)
+            )
+            time_series = {
+                "historical_portfolio_value": historical_portfolio_value,
+                "historical_cashflow": historical_cashflow,
+                "combined_data": combined_data,
+            }
 
     # Calculate annual growth rate
     annual_growth_rate = 0
-    # Stop the profiler
-    profiler.disable()
-
-    if DEBUG:
-        profiler.disable()
-        s = io.StringIO()
-        ps = pstats.Stats(profiler, stream=s).sort_stats("cumtime")
-        ps.print_stats(10)  # Limit output to the top 10 functions
-        print(s.getvalue())
 
     # Return results
     return {
         "total_dividends": total_dividends_received,
+        "dividend_breakdown": dividend_breakdown,
         "total_fees": total_fees,
         "fee_breakdown": fee_summary,
+        "monthly_fees": monthly_fees,
         "profit_loss": profit_loss,
         # "profit_loss_breakdown": profit_loss_breakdown,
         "portfolio_value": portfolio_value,
         "cash_balance": cash,
-        "historical_portfolio_value": historical_portfolio_value,
-        "historical_cashflow": historical_cashflow,
-        "combined_data": combined_data,
+        **time_series,
         "annual_growth_rate": round(annual_growth_rate, 2),
     }
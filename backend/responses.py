@@ -0,0 +1,98 @@
+import gzip
+import json
+
+import numpy as np
+from fastapi.responses import Response
+
+# orjson and brotli are dependencies, the fallbacks only keep an install
+# without them working
+try:
+    import orjson
+except ImportError:  # fall back to the standard library encoder
+    orjson = None
+
+try:
+    import brotli
+except ImportError:  # responses are then gzip-compressed at best
+    brotli = None
+
+# Bodies smaller than this are sent uncompressed
+COMPRESS_MIN_BYTES = 1024
+GZIP_LEVEL = 4
+BROTLI_QUALITY = 5
+
+# Supported content codings, preferred first
+CONTENT_ENCODINGS = ("br", "gzip") if brotli is not None else ("gzip",)
+
+
+def _default(value):
+    # NumPy values the encoder does not handle natively (for orjson only
+    # non-contiguous arrays)
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def encode_json(content):
+    """
+    Encodes `content` to compact JSON bytes, NumPy arrays and scalars included.
+    orjson writes NaN as null; the standard library fallback rejects it, as
+    JSONResponse did.
+    """
+    if orjson is not None:
+        return orjson.dumps(
+            content, default=_default, option=orjson.OPT_SERIALIZE_NUMPY
+        )
+    return json.dumps(
+        content, default=_default, separators=(",", ":"), allow_nan=False
+    ).encode()
+
+
+def negotiate_encoding(accept_encoding):
+    """
+    Picks the preferred supported coding from an Accept-Encoding header, or
+    None for an uncompressed response.
+    """
+    accepted = {}
+    for part in (accept_encoding or "").lower().split(","):
+        coding, _, params = part.strip().partition(";")
+        quality = 1.0
+        for param in params.split(";"):
+            name, _, value = param.strip().partition("=")
+            if name == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if coding:
+            accepted[coding] = quality
+
+    best, best_quality = None, 0.0
+    for coding in CONTENT_ENCODINGS:
+        quality = accepted.get(coding, accepted.get("*", 0.0))
+        if quality > best_quality:
+            best, best_quality = coding, quality
+    return best
+
+
+def compress(body, encoding):
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    if encoding == "gzip":
+        return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+    return body
+
+
+def json_response(body, accept_encoding="", headers=None):
+    """
+    Builds a Response from encoded JSON `body`, compressed with the coding
+    negotiated from `accept_encoding` when it is large enough.
+    """
+    headers = dict(headers or {}, Vary="Accept-Encoding")
+    encoding = negotiate_encoding(accept_encoding)
+    if encoding is not None and len(body) >= COMPRESS_MIN_BYTES:
+        body = compress(body, encoding)
+        headers["Content-Encoding"] = encoding
+    return Response(content=body, media_type="application/json", headers=headers)
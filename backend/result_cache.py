@@ -0,0 +1,82 @@
+import os
+import hashlib
+import threading
+from collections import OrderedDict
+from datetime import datetime
+
+from db import DB_PATH, data_versions, get_connection
+from instrumentation import count
+
+# Upper bounds of the in-process /upload result cache
+RESULT_CACHE_MAX_ENTRIES = int(os.environ.get("RESULT_CACHE_MAX_ENTRIES", "256"))
+RESULT_CACHE_MAX_BYTES = int(
+    os.environ.get("RESULT_CACHE_MAX_BYTES", str(64 * 1024 * 1024))
+)
+
+
+def market_data_version(db_path=DB_PATH):
+    """
+    Identifies the market data an upload is computed from: today's date (the
+    "as of" date) plus the write counters of stock_data and exchange_rates, so
+    the version changes whenever either table gains or updates rows.
+    """
+    versions = data_versions(get_connection(db_path))
+    return (
+        f"{datetime.now():%Y-%m-%d}:{versions.get('stock_data', 0)}"
+        f":{versions.get('exchange_rates', 0)}"
+    )
+
+
+def upload_cache_key(file_digests, db_path=DB_PATH):
+    """
+    Content address of an upload: the digests of the uploaded files (see
+    ingestion.hash_upload) and the market data version.
+    """
+    digest = hashlib.sha256()
+    for file_digest in file_digests:
+        digest.update(file_digest.encode() + b":")
+    digest.update(market_data_version(db_path).encode())
+    return digest.hexdigest()
+
+
+class ResultCache:
+    """
+    Thread-safe LRU of encoded responses, bounded by entry count and total bytes.
+    """
+
+    def __init__(
+        self, max_entries=RESULT_CACHE_MAX_ENTRIES, max_bytes=RESULT_CACHE_MAX_BYTES
+    ):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            body = self._entries.get(key)
+            if body is not None:
+                self._entries.move_to_end(key)
+        count("result_cache.hits" if body is not None else "result_cache.misses")
+        return body
+
+    def put(self, key, body):
+        if len(body) > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._size -= len(self._entries.pop(key))
+            self._entries[key] = body
+            self._size += len(body)
+            while len(self._entries) > self.max_entries or self._size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+
+upload_results = ResultCache()
@@ -1,7 +1,15 @@
+import os
 import yfinance as yf
-import sqlite3
+import hashlib
+import json
+import time
+import numpy as np
 import pandas as pd
 from datetime import datetime, timedelta, date
+from typing import NamedTuple
+from concurrent.futures import ThreadPoolExecutor
+from db import DB_PATH, bump_data_version, data_versions, get_connection
+from price_store import get_price_store
 
 
 # def get_stock_data(symbol: str, start='2010-01-01'):
@@ -20,14 +28,36 @@ from datetime import datetime, timedelta, date
 #         return None
 
 
-def get_stock_data(symbol: str, start="2010-01-01"):
+# Maximum number of symbols downloaded at the same time
+REFRESH_MAX_WORKERS = 8
+
+STOCK_DATA_COLUMNS = [
+    "Date",
+    "Ticker",
+    "Open",
+    "High",
+    "Low",
+    "Close",
+    "Volume",
+    "Dividends",
+    "Stock_Splits",
+]
+
+
+def fetch_yfinance_history(symbol, start):
+    """
+    Default market-data fetcher: daily history for `symbol` from `start` onwards.
     """
-    Fetches historical stock data since 2010 for a given company symbol using yfinance.
+    return yf.Ticker(symbol).history(start=start)
+
+
+def get_stock_data(symbol: str, start="2010-01-01", fetcher=fetch_yfinance_history):
+    """
+    Fetches historical stock data since `start` for a given company symbol.
     Adjusts for stock splits.
     """
     try:
-        ticker = yf.Ticker(symbol)
-        data = ticker.history(start=start)
+        data = fetcher(symbol, start)
         data.reset_index(inplace=True)
         data["Date"] = data["Date"].dt.strftime(
             "%Y-%m-%d"
@@ -46,78 +76,208 @@ def get_stock_data(symbol: str, start="2010-01-01"):
         data.columns = data.columns.str.replace(" ", "_")
 
         # Return adjusted prices
-        return data[
-            [
-                "Date",
-                "Ticker",
-                "Open",
-                "High",
-                "Low",
-                "Close",
-                "Volume",
-                "Dividends",
-                "Stock_Splits",
-            ]
-        ]
+        return data[STOCK_DATA_COLUMNS]
     except Exception as e:
         print(f"Error fetching data for {symbol}: {e}")
         return None
 
 
-def update_stock_data_table(symbols, db_path="stocks.db"):
+def update_stock_data_table(
+    symbols,
+    db_path=DB_PATH,
+    fetcher=fetch_yfinance_history,
+    max_workers=REFRESH_MAX_WORKERS,
+):
     """
     Updates the stock data table for the given list of symbols in an SQLite database.
-    Only fetches and adds missing or outdated data.
+    Only the missing date window of each symbol is fetched, up to `max_workers`
+    symbols at a time, and all new rows are written in a single transaction.
+    `fetcher(symbol, start)` must return a yfinance-style history DataFrame.
     """
-    conn = sqlite3.connect(db_path)
+    symbols = [symbol for symbol in dict.fromkeys(symbols) if symbol]
+    if not symbols:
+        return
+
+    conn = get_connection(db_path)
     cursor = conn.cursor()
 
+    # Check the latest available date of every symbol in the database
+    placeholders = ",".join("?" * len(symbols))
+    cursor.execute(
+        f"""
+        SELECT Ticker, MAX(Date) FROM stock_data
+        WHERE Ticker IN ({placeholders}) GROUP BY Ticker
+    """,
+        symbols,
+    )
+    last_dates = dict(cursor.fetchall())
+
+    now = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    windows = {}
     for symbol in symbols:
-        # Check the latest available date for the symbol in the database
-        cursor.execute(
-            """
-            SELECT MAX(Date) FROM stock_data WHERE Ticker = ?
-        """,
-            (symbol,),
-        )
-        result = cursor.fetchone()
-        last_date_in_db = result[0]
+        last_date_in_db = last_dates.get(symbol)
 
         # If no data is in the database, fetch all data since 2010
         if last_date_in_db is None:
             print(f"No data found for {symbol}, fetching all data since 2010.")
-            stock_data = get_stock_data(symbol)
+            windows[symbol] = "2010-01-01"
+            continue
+
+        # Otherwise, fetch data from the day after the last date if it's outdated
+        next_date = datetime.strptime(last_date_in_db, "%Y-%m-%d") + timedelta(days=1)
+        if next_date <= now and now.weekday() < 5:
+            print(f"Updating data for {symbol} from {next_date:%Y-%m-%d} to today.")
+            windows[symbol] = next_date.strftime("%Y-%m-%d")
         else:
-            # Otherwise, fetch data from the last date up to today if it’s outdated
-            last_date_in_db_datetime = datetime.strptime(last_date_in_db, "%Y-%m-%d")
-            now = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
-            if last_date_in_db_datetime < now and now.weekday() < 5:
-                print(
-                    f"Updating data for {symbol} from {last_date_in_db_datetime + pd.Timedelta(days=1)} to today."
-                )
-                stock_data = get_stock_data(symbol)
-                stock_data = stock_data[stock_data["Date"] > last_date_in_db]
-            else:
-                print(f"Data for {symbol} is already up-to-date.")
-                stock_data = None
+            print(f"Data for {symbol} is already up-to-date.")
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        results = executor.map(
+            lambda symbol: get_stock_data(symbol, windows[symbol], fetcher), windows
+        )
+        fetched = dict(zip(windows, results))
+
+    rows = []
+    for symbol, stock_data in fetched.items():
+        if stock_data is None:
+            continue
+        last_date_in_db = last_dates.get(symbol)
+        if last_date_in_db is not None:
+            stock_data = stock_data[stock_data["Date"] > last_date_in_db]
+        if not stock_data.empty:
+            rows.extend(stock_data.astype(object).itertuples(index=False, name=None))
+            print(f"Fetched {len(stock_data)} new rows for {symbol}.")
+
+    # If there's new or missing data, upsert it into the database in one go
+    with conn:
+        conn.executemany(
+            """
+            INSERT INTO stock_data (Date, Ticker, Open, High, Low, Close, Volume,
+                                    Dividends, Stock_Splits)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (Date, Ticker) DO UPDATE SET
+                Open = excluded.Open,
+                High = excluded.High,
+                Low = excluded.Low,
+                Close = excluded.Close,
+                Volume = excluded.Volume,
+                Dividends = excluded.Dividends,
+                Stock_Splits = excluded.Stock_Splits
+        """,
+            rows,
+        )
+        if rows:
+            bump_data_version(conn, "stock_data")
+    print(f"Stock data update complete, inserted {len(rows)} rows.")
+
+    # Keep the columnar copy of the closes in step with the table
+    store = get_price_store()
+    if store is not None:
+        print(f"Price store: appended {store.sync(conn, symbols)} closes.")
+
+
+# Maximum number of tickers bound into a single `IN (...)` price query
+PRICE_PANEL_CHUNK_SIZE = 500
+
+# Stored profit/loss of a replaced lot set is dropped once it went unused this
+# long, and of any lot set (e.g. of products no longer held) after the retention
+PROFIT_LOSS_REPLACED_SECONDS = 60 * 60
+PROFIT_LOSS_RETENTION_SECONDS = 30 * 24 * 60 * 60
+
+
+class PricePanel(NamedTuple):
+    """Closing prices as a sorted dates array and a dates x tickers float64 matrix."""
+
+    dates: np.ndarray
+    tickers: list
+    closes: np.ndarray
+
+    def column(self, ticker):
+        return self.closes[:, self.tickers.index(ticker)]
+
 
-        # If there's new or missing data, insert it into the database
-        if stock_data is not None and not stock_data.empty:
-            stock_data.to_sql("stock_data", conn, if_exists="append", index=False)
-            print(f"Inserted {len(stock_data)} new rows for {symbol}.")
+def load_price_panel(ticker_ranges, db_path=DB_PATH):
+    """
+    Loads the closes for all tickers in `ticker_ranges` (ticker -> (start, end) as
+    'YYYY-MM-DD' strings) into a PricePanel. Tickers are fetched in chunks of
+    PRICE_PANEL_CHUNK_SIZE over the union of their date ranges, so the number of
+    queries depends on the number of tickers, not on the number of lots.
+    Tickers in the columnar price store are sliced from it instead of queried.
+    Missing closes are NaN.
+    """
+    tickers = sorted(ticker_ranges)
+    ticker_index = {ticker: i for i, ticker in enumerate(tickers)}
+    store = get_price_store()
+    cursor = get_connection(db_path).cursor()
+
+    # Parallel arrays of (date, ticker position, close) over all sources
+    row_dates, row_tickers, row_closes = [], [], []
+    for i in range(0, len(tickers), PRICE_PANEL_CHUNK_SIZE):
+        chunk = tickers[i : i + PRICE_PANEL_CHUNK_SIZE]
+        start = min(ticker_ranges[ticker][0] for ticker in chunk)
+        end = max(ticker_ranges[ticker][1] for ticker in chunk)
+
+        missing = []
+        for ticker in chunk:
+            stored = store.slice(ticker, start, end) if store is not None else None
+            if stored is None:
+                missing.append(ticker)
+                continue
+            days, closes = stored
+            row_dates.append(days.astype("datetime64[D]"))
+            row_tickers.append(np.full(len(days), ticker_index[ticker]))
+            row_closes.append(closes)
+        if not missing:
+            continue
+
+        placeholders = ",".join("?" * len(missing))
+        cursor.execute(
+            f"""
+            SELECT Date, Ticker, Close FROM stock_data
+            WHERE Ticker IN ({placeholders}) AND Date BETWEEN ? AND ?
+        """,
+            (*missing, start, end),
+        )
+        rows = cursor.fetchall()
+        if rows:
+            dates, symbols, closes = zip(*rows)
+            row_dates.append(np.array(dates, dtype="datetime64[D]"))
+            row_tickers.append(pd.Index(tickers).get_indexer(symbols))
+            row_closes.append(np.array(closes, dtype="float64"))
+
+    row_dates = np.concatenate(row_dates) if row_dates else np.array([], "<M8[D]")
+    if not len(row_dates):
+        return PricePanel(row_dates, tickers, np.empty((0, len(tickers))))
 
-    conn.commit()
-    conn.close()
-    print("Stock data update complete.")
+    dates, date_index = np.unique(row_dates, return_inverse=True)
+    closes = np.full((len(dates), len(tickers)), np.nan)
+    closes[date_index, np.concatenate(row_tickers)] = np.concatenate(row_closes)
+    return PricePanel(dates, tickers, closes)
 
 
-def calculate_daily_profit_loss(positions, products_to_fetch, db_path="stocks.db"):
-    conn = sqlite3.connect(db_path)
+def load_exchange_rate_array(dates, db_path=DB_PATH):
+    """
+    Returns the EUR/USD rate for each of `dates` (datetime64[D]), NaN where unknown.
+    """
+    conn = get_connection(db_path)
     cursor = conn.cursor()
-    exchange_rates = load_exchange_rates(db_path)
+    cursor.execute(
+        "SELECT date, exchange_rate FROM eur_usd_exchange WHERE date BETWEEN ? AND ?",
+        (str(dates.min()), str(dates.max())),
+    )
+    rows = cursor.fetchall()
 
-    daily_profits = {}  # Dictionary to store daily profit/loss for each stock and day
+    rates = pd.Series(dict(rows), dtype="float64")
+    return rates.reindex(dates.astype(str)).to_numpy(dtype="float64", copy=True)
 
+
+def _collect_lots(positions, products_to_fetch):
+    """
+    Groups the lots by (company, ticker, currency) column. Returns
+    {column: [(quantity, cost_per_unit, start, end)]} with 'YYYY-MM-DD' dates
+    and end None while the lot is still open.
+    """
+    columns = {}
     for company, lots in positions.items():
         ticker = products_to_fetch.get(company)
 
@@ -126,57 +286,290 @@ def calculate_daily_profit_loss(positions, products_to_fetch, db_path="stocks.db
             continue
 
         for lot in lots:
-            quantity = lot["quantity"]
-            cost_per_unit = lot["cost_per_unit"]
-            start_date = lot["start_date"]
-            end_date = lot["end_date"] if lot["end_date"] else datetime.now()
-            currency = lot.get("currency", "USD")
-
-            # Query stock_data for prices between start_date and end_date
-            cursor.execute(
-                """
-                SELECT Date, Close FROM stock_data
-                WHERE Ticker = ? AND Date BETWEEN ? AND ?
-                ORDER BY Date
-            """,
+            key = (company, ticker, lot.get("currency", "USD"))
+            columns.setdefault(key, []).append(
                 (
-                    ticker,
-                    start_date.strftime("%Y-%m-%d"),
-                    end_date.strftime("%Y-%m-%d"),
-                ),
+                    lot["quantity"],
+                    lot["cost_per_unit"],
+                    lot["start_date"].strftime("%Y-%m-%d"),
+                    lot["end_date"].strftime("%Y-%m-%d") if lot["end_date"] else None,
+                )
+            )
+    return columns
+
+
+def _fold_lots(columns, db_path, since=None):
+    """
+    Folds the lots of `columns` (see _collect_lots) into a dates x column matrix
+    of daily profit/loss. Prices are only loaded from `since[column]` onwards
+    when given. Returns the dates, the column keys, the matrix and a mask of the
+    days on which each column holds a priced lot, or None without prices.
+    """
+    since = since or {}
+    keys = list(columns)
+    today = datetime.now().strftime("%Y-%m-%d")
+    lot_columns, quantities, costs, starts, ends = [], [], [], [], []
+    ticker_ranges = {}
+    for column, key in enumerate(keys):
+        for quantity, cost_per_unit, start, end in columns[key]:
+            lot_columns.append(column)
+            quantities.append(quantity)
+            costs.append(cost_per_unit)
+            starts.append(start)
+            ends.append(end or today)
+
+            ticker = key[1]
+            first_needed = max(start, since.get(key, start))
+            low, high = ticker_ranges.get(ticker, (first_needed, ends[-1]))
+            ticker_ranges[ticker] = (min(low, first_needed), max(high, ends[-1]))
+
+    if not keys:
+        return None
+
+    panel = load_price_panel(ticker_ranges, db_path)
+    if not len(panel.dates):
+        return None
+
+    ticker_index = {ticker: i for i, ticker in enumerate(panel.tickers)}
+    closes = panel.closes[:, [ticker_index[ticker] for _, ticker, _ in keys]]
+
+    # Convert USD columns to EUR, leaving days without a known rate untouched
+    rates = load_exchange_rate_array(panel.dates, db_path)
+    rates = np.where(np.isnan(rates) | (rates == 0), 1.0, rates)
+    usd_columns = np.array([currency == "USD" for _, _, currency in keys])
+    closes[:, usd_columns] /= rates[:, None]
+
+    # Lots -> holdings: add each lot on its first day and remove it after its last
+    lot_columns = np.array(lot_columns, dtype=np.intp)
+    quantities = np.array(quantities, dtype="float64")
+    first = np.searchsorted(panel.dates, np.array(starts, dtype="datetime64[D]"))
+    last = np.searchsorted(
+        panel.dates, np.array(ends, dtype="datetime64[D]"), side="right"
+    )
+    held = first < last
+
+    shape = (len(panel.dates) + 1, len(keys))
+    holdings = np.zeros(shape)
+    cost_basis = np.zeros(shape)
+    open_lots = np.zeros(shape)
+    for matrix, values in (
+        (holdings, quantities),
+        (cost_basis, quantities * np.array(costs, dtype="float64")),
+        (open_lots, np.ones_like(quantities)),
+    ):
+        np.add.at(matrix, (first[held], lot_columns[held]), values[held])
+        np.add.at(matrix, (last[held], lot_columns[held]), -values[held])
+    holdings = holdings.cumsum(axis=0)[:-1]
+    cost_basis = cost_basis.cumsum(axis=0)[:-1]
+    open_lots = open_lots.cumsum(axis=0)[:-1]
+
+    priced = ~np.isnan(closes)
+    values = np.where(priced, np.nan_to_num(closes) * holdings - cost_basis, 0.0)
+    return panel.dates, keys, values, priced & (open_lots > 0.5)
+
+
+def _daily_lot_values(positions, products_to_fetch, db_path):
+    return _fold_lots(_collect_lots(positions, products_to_fetch), db_path)
+
+
+def lot_fingerprint(key, lots):
+    """
+    Identifies a column and its exact set of lots, see materialize_profit_loss.
+    """
+    payload = json.dumps([list(key), sorted(lots, key=repr)], default=str)
+    return hashlib.sha1(payload.encode()).hexdigest()
+
+
+def _last_profit_loss_dates(cursor, fingerprints):
+    """
+    Returns {fingerprint: last stored date} of the `fingerprints` with rows.
+    """
+    last_dates = {}
+    for i in range(0, len(fingerprints), PRICE_PANEL_CHUNK_SIZE):
+        chunk = fingerprints[i : i + PRICE_PANEL_CHUNK_SIZE]
+        placeholders = ",".join("?" * len(chunk))
+        cursor.execute(
+            f"""
+            SELECT fingerprint, MAX(date) FROM profit_loss
+            WHERE fingerprint IN ({placeholders}) GROUP BY fingerprint
+        """,
+            chunk,
+        )
+        last_dates.update(cursor.fetchall())
+    return last_dates
+
+
+def _profit_loss_rows(columns, fingerprints, last_dates, db_path):
+    """
+    Computes the profit_loss rows of `columns` missing after `last_dates` (see
+    _last_profit_loss_dates). Returns {column: first recomputed date} of the
+    columns with stored rows, and the (fingerprint, date, profit_loss) rows.
+    """
+    since = {
+        key: last_dates[fingerprint]
+        for key, fingerprint in fingerprints.items()
+        if fingerprint in last_dates
+    }
+    folded = _fold_lots(columns, db_path, since)
+
+    rows = []
+    if folded is not None:
+        dates, keys, values, active = folded
+        date_strs = dates.astype(str)
+        for column, key in enumerate(keys):
+            needed = active[:, column]
+            if key in since:
+                needed = needed & (date_strs >= since[key])
+            rows.extend(
+                zip(
+                    [fingerprints[key]] * int(needed.sum()),
+                    date_strs[needed].tolist(),
+                    values[needed, column].tolist(),
+                )
             )
+    return since, rows
+
+
+def materialize_profit_loss(columns, db_path=DB_PATH):
+    """
+    Brings the profit_loss table up to date for `columns` (see _collect_lots) and
+    returns the stored fingerprint of each column.
+
+    Rows are keyed by a fingerprint of the column's lots, so a column whose lots
+    did not change only recomputes the days from its last stored date (which may
+    have had a provisional close) onwards, and a changed or new column is
+    computed in full. Only days with a priced open lot are stored. New EUR/USD
+    rates drop the rows of USD lots they affect, see update_exchange_rate_data.
+
+    The rows are computed without holding the write lock. The writes run in one
+    immediate (write-locked) transaction, which first checks that neither the
+    market data nor the stored rows changed meanwhile and recomputes them if
+    they did, so a concurrent call for the same lots only adds its last day.
+    The rows of lot sets that were replaced or went unused are dropped, see
+    _prune_profit_loss.
+    """
+    fingerprints = {key: lot_fingerprint(key, lots) for key, lots in columns.items()}
+    stored = list(fingerprints.values())
+    conn = get_connection(db_path)
+    cursor = conn.cursor()
+    state = (data_versions(cursor), _last_profit_loss_dates(cursor, stored))
+    since, rows = _profit_loss_rows(columns, fingerprints, state[1], db_path)
+
+    with conn:
+        conn.execute("BEGIN IMMEDIATE")
+        cursor = conn.cursor()
+        current = (data_versions(cursor), _last_profit_loss_dates(cursor, stored))
+        if current != state:
+            since, rows = _profit_loss_rows(columns, fingerprints, current[1], db_path)
+
+        cursor.executemany(
+            "DELETE FROM profit_loss WHERE fingerprint = ? AND date >= ?",
+            [(fingerprints[key], date_) for key, date_ in since.items()],
+        )
+        cursor.executemany(
+            """
+            INSERT INTO profit_loss (fingerprint, date, profit_loss)
+            VALUES (?, ?, ?)
+            ON CONFLICT (fingerprint, date) DO UPDATE SET
+                profit_loss = excluded.profit_loss
+        """,
+            rows,
+        )
+        pruned = _prune_profit_loss(cursor, fingerprints)
+    print(
+        f"Profit/loss: recomputed {len(columns) - len(since)} of {len(columns)} "
+        f"columns in full, stored {len(rows)} rows, dropped {pruned} lot sets."
+    )
+    return fingerprints
+
+
+def _prune_profit_loss(cursor, fingerprints):
+    """
+    Marks `fingerprints` ({column key: fingerprint}) as used now and deletes
+    the rows of other lot sets of the same columns unused for
+    PROFIT_LOSS_REPLACED_SECONDS (a concurrent request may still read them
+    until then), and of any lot set unused for PROFIT_LOSS_RETENTION_SECONDS.
+    Returns the number of lot sets dropped.
+    """
+    now = time.time()
+    cursor.executemany(
+        """
+        INSERT INTO profit_loss_fingerprints
+            (fingerprint, column_key, currency, used_at)
+        VALUES (?, ?, ?, ?)
+        ON CONFLICT (fingerprint) DO UPDATE SET
+            column_key = excluded.column_key,
+            currency = excluded.currency,
+            used_at = excluded.used_at
+    """,
+        [
+            (fingerprint, json.dumps(list(key)), key[2], now)
+            for key, fingerprint in fingerprints.items()
+        ],
+    )
+
+    column_keys = [json.dumps(list(key)) for key in fingerprints]
+    expired = set()
+    for i in range(0, len(column_keys), PRICE_PANEL_CHUNK_SIZE):
+        chunk = column_keys[i : i + PRICE_PANEL_CHUNK_SIZE]
+        placeholders = ",".join("?" * len(chunk))
+        cursor.execute(
+            f"""
+            SELECT fingerprint FROM profit_loss_fingerprints
+            WHERE column_key IN ({placeholders}) AND used_at < ?
+        """,
+            [*chunk, now - PROFIT_LOSS_REPLACED_SECONDS],
+        )
+        expired.update(fingerprint for (fingerprint,) in cursor.fetchall())
+    cursor.execute(
+        "SELECT fingerprint FROM profit_loss_fingerprints WHERE used_at < ?",
+        (now - PROFIT_LOSS_RETENTION_SECONDS,),
+    )
+    expired.update(fingerprint for (fingerprint,) in cursor.fetchall())
 
-            daily_prices = cursor.fetchall()
+    expired = [(fingerprint,) for fingerprint in expired]
+    cursor.executemany("DELETE FROM profit_loss WHERE fingerprint = ?", expired)
+    cursor.executemany(
+        "DELETE FROM profit_loss_fingerprints WHERE fingerprint = ?", expired
+    )
+    return len(expired)
 
-            for date_str, close_price in daily_prices:
-                date = datetime.strptime(date_str, "%Y-%m-%d")
-                if currency == "USD":
-                    # Get the EUR/USD exchange rate for the specific date
-                    exchange_rate = exchange_rates.get(date)
-                    if exchange_rate:
-                        # Convert close price from USD to EUR
-                        close_price = close_price / exchange_rate
 
-                # Calculate daily profit/loss
-                daily_profit_loss = (close_price - cost_per_unit) * quantity
+def _to_datetimes(dates):
+    return pd.DatetimeIndex(dates).to_pydatetime()
 
-                # Store daily profit/loss in dictionary
-                if company not in daily_profits:
-                    daily_profits[company] = {}
 
-                daily_profits[company][date] = (
-                    daily_profits[company].get(date, 0) + daily_profit_loss
+def calculate_daily_profit_loss(positions, products_to_fetch, db_path=DB_PATH):
+    """
+    Calculates the daily profit/loss of each company from a single price panel.
+    Returns {company: {date: profit_loss}}.
+    """
+    lot_values = _daily_lot_values(positions, products_to_fetch, db_path)
+    if lot_values is None:
+        return {}
+    dates, keys, values, active = lot_values
+
+    daily_profits = {}
+    companies = np.array([company for company, _, _ in keys], dtype=object)
+    for company in dict.fromkeys(companies):
+        in_company = companies == company
+        has_position = active[:, in_company].any(axis=1)
+        if has_position.any():
+            daily_profits[company] = dict(
+                zip(
+                    _to_datetimes(dates[has_position]),
+                    values[has_position][:, in_company].sum(axis=1).tolist(),
                 )
+            )
 
-    conn.close()
     return daily_profits
 
 
-def load_exchange_rates(db_path="stocks.db"):
+def load_exchange_rates(db_path=DB_PATH):
     """
     Load all EUR/USD exchange rates from the database into a dictionary.
     """
-    conn = sqlite3.connect(db_path)
+    conn = get_connection(db_path)
     cursor = conn.cursor()
 
     # Load all exchange rates into a dictionary
@@ -185,115 +578,159 @@ def load_exchange_rates(db_path="stocks.db"):
         datetime.strptime(row[0], "%Y-%m-%d"): row[1] for row in cursor.fetchall()
     }
 
-    conn.close()
     return exchange_rates
 
 
 def calculate_total_daily_profit_loss(
-    positions, products_to_fetch, db_path="stocks.db"
+    positions, products_to_fetch, db_path=DB_PATH, materialize=True
 ):
-    conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
-
-    # Dictionary to store overall daily profit/loss across all companies
-    total_daily_profits = {}
-    exchange_rates = load_exchange_rates(db_path)
-
-    for company, lots in positions.items():
-        ticker = products_to_fetch.get(company)
-
-        if not ticker:
-            print(f"No ticker found for {company}")
-            continue
-
-        for lot in lots:
-            quantity = lot["quantity"]
-            cost_per_unit = lot["cost_per_unit"]
-            start_date = lot["start_date"]
-            end_date = lot["end_date"] if lot["end_date"] else datetime.now()
-            currency = lot.get("currency", "USD")
-
-            # Query stock_data for prices between start_date and end_date
-            cursor.execute(
-                """
-                SELECT Date, Close FROM stock_data
-                WHERE Ticker = ? AND Date BETWEEN ? AND ?
-                ORDER BY Date
-            """,
-                (
-                    ticker,
-                    start_date.strftime("%Y-%m-%d"),
-                    end_date.strftime("%Y-%m-%d"),
-                ),
-            )
-
-            daily_prices = cursor.fetchall()
-
-            for date_str, close_price in daily_prices:
-                date_ = datetime.strptime(date_str, "%Y-%m-%d")
-                if currency == "USD":
-                    # Get the EUR/USD exchange rate for the specific date
-                    exchange_rate = exchange_rates.get(date_)
-                    if exchange_rate:
-                        # Convert close price from USD to EUR
-                        close_price = close_price / exchange_rate
-                # Calculate daily profit/loss for this lot
-                daily_profit_loss = (close_price - cost_per_unit) * quantity
+    """
+    Calculates the overall daily profit/loss across all lots.
+    Closes for every ticker are loaded once as a date x column price panel and the
+    lots are folded into per-column holdings, so each day's total is a single
+    row-wise product. With `materialize` the per-column series are kept in the
+    profit_loss table and only the days and lots that changed are recomputed.
+    Returns the sorted datetime64[D] dates and the float64 totals.
+    """
+    if not materialize:
+        lot_values = _daily_lot_values(positions, products_to_fetch, db_path)
+        if lot_values is None:
+            return np.array([], dtype="datetime64[D]"), np.array([])
+        dates, _, values, active = lot_values
+
+        has_position = active.any(axis=1)
+        return dates[has_position], values[has_position].sum(axis=1)
+
+    fingerprints = list(
+        materialize_profit_loss(
+            _collect_lots(positions, products_to_fetch), db_path
+        ).values()
+    )
+
+    # Sum the stored series of all columns per day
+    conn = get_connection(db_path)
+    totals = {}
+    for i in range(0, len(fingerprints), PRICE_PANEL_CHUNK_SIZE):
+        chunk = fingerprints[i : i + PRICE_PANEL_CHUNK_SIZE]
+        placeholders = ",".join("?" * len(chunk))
+        rows = conn.execute(
+            f"""
+            SELECT date, SUM(profit_loss) FROM profit_loss
+            WHERE fingerprint IN ({placeholders}) GROUP BY date
+        """,
+            chunk,
+        ).fetchall()
+        for date_, value in rows:
+            totals[date_] = totals.get(date_, 0) + value
 
-                # Aggregate the daily profit/loss at the total level
-                if date_ not in total_daily_profits:
-                    total_daily_profits[date_] = 0
-                total_daily_profits[date_] += daily_profit_loss
+    dates = sorted(totals)
+    return (
+        np.array(dates, dtype="datetime64[D]"),
+        np.array([totals[date_] for date_ in dates], dtype="float64"),
+    )
 
-    conn.close()
 
-    # Sort the results by date for easier reading
-    sorted_total_daily_profits = dict(sorted(total_daily_profits.items()))
-    return sorted_total_daily_profits
+# Currency pairs kept in the exchange_rates table, as EUR<quote> Yahoo symbols
+FX_PAIRS = [
+    pair
+    for pair in os.environ.get("FX_PAIRS", "EURUSD,EURGBP,EURCHF").split(",")
+    if pair
+]
 
 
-def update_exchange_rate_data(db_path="stocks.db"):
-    conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
+def update_exchange_rate_data(
+    db_path=DB_PATH, pairs=FX_PAIRS, fetcher=fetch_yfinance_history
+):
+    """
+    Brings the exchange_rates table up to date for `pairs` ("EURUSD", ...).
+    Only the days after each pair's last stored rate are fetched, and all new
+    rates are written in one bulk upsert. The sync date of each pair is
+    recorded, so further calls on the same day are no-ops.
+    Returns the number of rates written.
+    """
+    conn = get_connection(db_path)
+    today = datetime.now().strftime("%Y-%m-%d")
+    synced = dict(conn.execute("SELECT pair, synced_on FROM fx_sync").fetchall())
+    pairs = [pair for pair in dict.fromkeys(pairs) if synced.get(pair) != today]
+    if not pairs:
+        print("Exchange rates are already up-to-date.")
+        return 0
+
+    # Check the latest date of every pair in the database
+    placeholders = ",".join("?" * len(pairs))
+    last_dates = dict(
+        conn.execute(
+            f"""
+            SELECT pair, MAX(date) FROM exchange_rates
+            WHERE pair IN ({placeholders}) GROUP BY pair
+        """,
+            pairs,
+        ).fetchall()
+    )
+
+    date_added = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    rows, synced_pairs = [], []
+    for pair in pairs:
+        last_date_in_db = last_dates.get(pair)
+        if last_date_in_db is None:
+            # If no data is present, fetch from 2010-01-01
+            start_date = "2010-01-01"
+        else:
+            # Fetch data from the day after the last recorded date
+            start_date = (
+                datetime.strptime(last_date_in_db, "%Y-%m-%d") + timedelta(days=1)
+            ).strftime("%Y-%m-%d")
+
+        if start_date <= today:
+            try:
+                closes = fetcher(f"{pair}=X", start_date)["Close"].dropna()
+            except Exception as e:
+                print(f"Error fetching exchange rates for {pair}: {e}")
+                continue
+            dates = np.asarray(closes.index.strftime("%Y-%m-%d"), dtype=object)
+            new = dates > (last_date_in_db or "")
+            rows.extend(
+                zip(
+                    [pair] * int(new.sum()),
+                    dates[new].tolist(),
+                    closes.to_numpy(dtype="float64")[new].tolist(),
+                    [date_added] * int(new.sum()),
+                )
+            )
+        synced_pairs.append((pair, today))
 
-    # Check the latest date in the database
-    cursor.execute("SELECT MAX(date) FROM eur_usd_exchange")
-    result = cursor.fetchone()
-    last_date_in_db = result[0]
-
-    # Determine start date for fetching data
-    if last_date_in_db is None:
-        # If no data is present, fetch from 2010-01-01
-        start_date = "2010-01-01"
-    else:
-        # Fetch data from the day after the last recorded date
-        start_date = (
-            datetime.strptime(last_date_in_db, "%Y-%m-%d") + timedelta(days=1)
-        ).strftime("%Y-%m-%d")
-
-    # Fetch data from start_date to today
-    eur_usd_data = yf.Ticker("EURUSD=X").history(start=start_date)
-    eur_usd_data.reset_index(inplace=True)
-    eur_usd_data["Date"] = eur_usd_data["Date"].dt.strftime(
-        "%Y-%m-%d"
-    )  # Format date as 'YYYY-MM-DD'
-
-    # Insert new data into the database
-    for _, row in eur_usd_data.iterrows():
-        date = row["Date"]
-        exchange_rate = row["Close"]
-
-        # Insert only if the date does not already exist
-        cursor.execute("SELECT 1 FROM eur_usd_exchange WHERE date = ?", (date,))
-        if cursor.fetchone() is None:
-            cursor.execute(
+    with conn:
+        conn.executemany(
+            """
+            INSERT INTO exchange_rates (pair, date, rate, date_added)
+            VALUES (?, ?, ?, ?)
+            ON CONFLICT (pair, date) DO UPDATE SET
+                rate = excluded.rate,
+                date_added = excluded.date_added
+        """,
+            rows,
+        )
+        if rows:
+            bump_data_version(conn, "exchange_rates")
+        usd_dates = [date_ for pair, date_, _, _ in rows if pair == "EURUSD"]
+        if usd_dates:
+            # Stored profit/loss of USD lots was converted with the old (or a
+            # missing) rate from the first new rate on, recompute it from there
+            conn.execute(
                 """
-                INSERT INTO eur_usd_exchange (date, exchange_rate, date_added)
-                VALUES (?, ?, ?)
+                DELETE FROM profit_loss WHERE date >= ? AND fingerprint IN (
+                    SELECT fingerprint FROM profit_loss_fingerprints
+                    WHERE currency IS NULL OR currency = 'USD'
+                )
             """,
-                (date, exchange_rate, datetime.now().strftime("%Y-%m-%d %H:%M:%S")),
+                (min(usd_dates),),
             )
-
-    conn.commit()
-    conn.close()
-    print("EUR/USD exchange rate data updated successfully.")
+        conn.executemany(
+            """
+            INSERT INTO fx_sync (pair, synced_on) VALUES (?, ?)
+            ON CONFLICT (pair) DO UPDATE SET synced_on = excluded.synced_on
+        """,
+            synced_pairs,
+        )
+    print(f"Exchange rate update complete, inserted {len(rows)} rates.")
+    return len(rows)
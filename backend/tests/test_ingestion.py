@@ -0,0 +1,51 @@
+import io
+import unittest
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+from amounts import ACCOUNT_NUMERIC_COLUMNS, parse_numbers
+from benchmarks.synthetic import generate_exports, make_products, price_history
+from ingestion import ACCOUNT_COLUMNS, ACCOUNT_DTYPES, read_account_csv
+
+CATEGORICAL_COLUMNS = ["Producto", "Variación", "Saldo"]
+
+
+class ReadAccountCsvTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        end = datetime(2024, 6, 28)
+        products = make_products(8)
+        closes, fx = price_history(products, end - timedelta(days=365), end)
+        cls.account_csv, _ = generate_exports(products, closes, fx, 300)
+
+    def read_at_once(self):
+        df = pd.read_csv(
+            io.BytesIO(self.account_csv),
+            usecols=lambda column: column in ACCOUNT_COLUMNS,
+            dtype=ACCOUNT_DTYPES,
+            decimal=",",
+        )
+        unparseable = pd.DataFrame(index=df.index)
+        for column in ACCOUNT_NUMERIC_COLUMNS:
+            df[column], unparseable[column] = parse_numbers(df[column])
+        return df, unparseable
+
+    def test_chunked_read_matches_one_read(self):
+        expected, expected_unparseable = self.read_at_once()
+        # Small chunks, so the categories differ between chunks
+        df, unparseable, stats = read_account_csv(
+            io.BytesIO(self.account_csv), chunk_rows=37
+        )
+
+        self.assertGreater(len(df), 37 * 10)
+        pd.testing.assert_frame_equal(df, expected)
+        pd.testing.assert_frame_equal(unparseable, expected_unparseable)
+        self.assertEqual(stats.rows, len(expected))
+        self.assertGreater(stats.rows_per_sec, 0)
+        for column in CATEGORICAL_COLUMNS:
+            self.assertIsInstance(df[column].dtype, pd.CategoricalDtype, column)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,46 @@
+import os
+import re
+import tempfile
+import unittest
+
+from benchmarks.query_plans import HOT_QUERIES
+from db import connect, create_tables
+
+# Tables read on every upload, none of them may be scanned
+HOT_TABLES = ("stock_data", "exchange_rates", "profit_loss", "tickers")
+
+
+class QueryPlanTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp = tempfile.TemporaryDirectory()
+        path = os.path.join(cls.tmp.name, "stocks.db")
+        create_tables(path)
+        cls.conn = connect(path)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.conn.close()
+        cls.tmp.cleanup()
+
+    def plan(self, query, parameters):
+        rows = self.conn.execute(f"EXPLAIN QUERY PLAN {query}", parameters)
+        return [row[3] for row in rows.fetchall()]
+
+    def test_hot_queries_use_their_index(self):
+        for name, query, parameters, index in HOT_QUERIES:
+            with self.subTest(name):
+                plan = self.plan(query, parameters)
+                searches = [step for step in plan if step.startswith("SEARCH")]
+                self.assertTrue(searches, plan)
+                for step in searches:
+                    self.assertRegex(step, rf"USING {index}\b")
+                for table in HOT_TABLES:
+                    scans = [
+                        step for step in plan if re.match(rf"SCAN {table}\b", step)
+                    ]
+                    self.assertEqual(scans, [], plan)
+
+
+if __name__ == "__main__":
+    unittest.main()
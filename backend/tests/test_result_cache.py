@@ -0,0 +1,69 @@
+import os
+import tempfile
+import unittest
+
+import pandas as pd
+
+from db import bump_data_version, close_connections, get_connection
+from result_cache import upload_cache_key
+from stock_service import update_stock_data_table
+
+
+def history(symbol, start):
+    """
+    yfinance-style daily history of two days.
+    """
+    close = [10.0, 10.5]
+    return pd.DataFrame(
+        {
+            "Open": close,
+            "High": close,
+            "Low": close,
+            "Close": close,
+            "Volume": 100,
+            "Dividends": 0.0,
+            "Stock Splits": 0.0,
+        },
+        index=pd.DatetimeIndex(["2024-01-02", "2024-01-03"], name="Date"),
+    )
+
+
+class UploadCacheKeyTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.tmp.name, "stocks.db")
+        update_stock_data_table(["AAA"], self.db_path, history)
+        self.conn = get_connection(self.db_path)
+
+    def tearDown(self):
+        close_connections()
+        self.tmp.cleanup()
+
+    def key(self):
+        return upload_cache_key(["account", "portfolio"], self.db_path)
+
+    def test_unchanged_market_data_hits(self):
+        self.assertEqual(self.key(), self.key())
+
+    def test_updated_row_misses(self):
+        before = self.key()
+        newest = "SELECT MAX(rowid), MAX(Date) FROM stock_data"
+        rowid_and_date = self.conn.execute(newest).fetchone()
+
+        # Same upsert as update_stock_data_table, on a row that already exists
+        with self.conn:
+            self.conn.execute(
+                """
+                INSERT INTO stock_data (Date, Ticker, Close) VALUES (?, ?, ?)
+                ON CONFLICT (Date, Ticker) DO UPDATE SET Close = excluded.Close
+            """,
+                ("2024-01-03", "AAA", 11.0),
+            )
+            bump_data_version(self.conn, "stock_data")
+
+        self.assertEqual(self.conn.execute(newest).fetchone(), rowid_and_date)
+        self.assertNotEqual(self.key(), before)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,159 +1,286 @@
 import os
-import json
 import yfinance as yf
-from yahooquery import search
-import aiohttp
 import pandas as pd
 from datetime import datetime
 import asyncio
-import sqlite3
+from db import DB_PATH, get_connection
+import threading
+import time
+from collections import OrderedDict
+from http_client import HTTP_CONNECTION_LIMIT_PER_HOST, fetch_json
+from workers import run_blocking
+from instrumentation import count
+from cache_store import SYMBOLS, SPOT_PRICES, FX, get_cache_store, flush_cache_stores
+
+# Symbol resolution settings and in-process caches, see resolve_tickers
+TICKER_LRU_SIZE = 4096
+TICKER_NOT_FOUND_TTL_SECONDS = 24 * 60 * 60
+# All lookups go to one host, more would only queue in the connection pool
+TICKER_LOOKUP_CONCURRENCY = int(
+    os.environ.get("TICKER_LOOKUP_CONCURRENCY", HTTP_CONNECTION_LIMIT_PER_HOST)
+)
+TICKER_QUERY_CHUNK_SIZE = 500
+
+_ticker_lru = OrderedDict()  # (db_path, product) -> (ticker, expiry or None)
+_ticker_lookups = {}  # search name -> in-flight lookup task
+_ticker_lock = threading.Lock()
+
+# Overridable so lookups can be pointed at a local stub server
+YAHOO_BASE_URL = os.environ.get("YAHOO_BASE_URL", "https://query1.finance.yahoo.com")
+
+
+def _lru_get(key):
+    """
+    Returns the cached symbol of `key`, "" for a remembered "not found" or None.
+    """
+    with _ticker_lock:
+        entry = _ticker_lru.get(key)
+        if entry is not None:
+            ticker, expiry = entry
+            if expiry is None or expiry > time.monotonic():
+                _ticker_lru.move_to_end(key)
+                count("ticker_lru.hits")
+                return ticker
+            del _ticker_lru[key]
+    count("ticker_lru.misses")
+    return None
+
+
+def _lru_put(key, ticker):
+    # "Not found" results are kept for TICKER_NOT_FOUND_TTL_SECONDS only
+    expiry = None if ticker else time.monotonic() + TICKER_NOT_FOUND_TTL_SECONDS
+    with _ticker_lock:
+        _ticker_lru[key] = (ticker, expiry)
+        _ticker_lru.move_to_end(key)
+        while len(_ticker_lru) > TICKER_LRU_SIZE:
+            _ticker_lru.popitem(last=False)
+
+
+def clear_ticker_caches(db_path=DB_PATH):
+    """
+    Forgets the cached symbols and "not found" results.
+    """
+    with _ticker_lock:
+        _ticker_lru.clear()
+    get_cache_store(db_path).clear(SYMBOLS)
 
-# Load or initialize caches
-TICKER_CACHE_FILE = "ticker_cache.json"
-PRICE_CACHE_FILE = "price_cache.json"
-USD_TO_EUR_CACHE_FILE = "usd_to_eur_cache.json"
+
+def normalize_product(product):
+    """
+    Strips share-class and listing noise from a product name before searching it.
+    """
+    return (
+        product.lower()
+        .replace("adr on ", "")
+        .replace("class c", "")
+        .replace("class a", "")
+        .replace("class b", "")
+        .replace(".com", "")
+        .strip()
+    )
 
 
-def create_ticker_table(db_name):
-    conn = sqlite3.connect(db_name)
+def _load_tickers(names, db_path):
+    """
+    Reads the stored symbols of all `names` in one query.
+    """
+    names = list(dict.fromkeys(names))
+    conn = get_connection(db_path)
     cursor = conn.cursor()
+    known = {}
+    for i in range(0, len(names), TICKER_QUERY_CHUNK_SIZE):
+        chunk = names[i : i + TICKER_QUERY_CHUNK_SIZE]
+        placeholders = ",".join("?" * len(chunk))
+        cursor.execute(
+            f"SELECT product, ticker FROM tickers WHERE product IN ({placeholders})",
+            chunk,
+        )
+        known.update(cursor.fetchall())
+    return known
+
 
-    # Create a table for storing ticker information
-    cursor.execute(
-        """
-        CREATE TABLE IF NOT EXISTS tickers (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            product TEXT UNIQUE,
-            ticker_symbol TEXT,
-            date_added TEXT
+def _store_tickers(tickers, db_path):
+    """
+    Writes new product -> symbol mappings in one transaction.
+    """
+    date_added = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    conn = get_connection(db_path)
+    with conn:
+        conn.executemany(
+            """
+            INSERT INTO tickers (product, ticker, date_added)
+            VALUES (?, ?, ?)
+            ON CONFLICT (product) DO NOTHING
+        """,
+            [(product, ticker, date_added) for product, ticker in tickers.items()],
         )
+
+
+async def _search_ticker_symbol(name, db_path):
     """
+    Searches Yahoo for `name`. Returns the symbol, "" if Yahoo does not know it
+    (remembered for TICKER_NOT_FOUND_TTL_SECONDS) or None if the request failed.
+    Concurrent searches for the same name share one in-flight request.
+    """
+    search = _ticker_lookups.get(name)
+    if search is None:
+        search = asyncio.ensure_future(_fetch_ticker_symbol(name, db_path))
+        _ticker_lookups[name] = search
+        search.add_done_callback(lambda _: _ticker_lookups.pop(name, None))
+    return await asyncio.shield(search)
+
+
+async def _fetch_ticker_symbol(name, db_path):
+    data = await fetch_json(f"{YAHOO_BASE_URL}/v1/finance/search", {"q": name})
+    if data is None:
+        # Request failed, try again next time
+        return None
+
+    quotes = data.get("quotes", [])
+    ticker = quotes[0]["symbol"] if quotes else ""
+    get_cache_store(db_path).set(
+        SYMBOLS, name, ticker, ttl=None if ticker else TICKER_NOT_FOUND_TTL_SECONDS
     )
+    return ticker
 
-    conn.commit()
-    conn.close()
 
+async def resolve_tickers(
+    products, db_path=DB_PATH, max_concurrency=TICKER_LOOKUP_CONCURRENCY
+):
+    """
+    Resolves many product names to ticker symbols at once ("" if unknown).
+    Known mappings and "not found" results come from the in-process LRU or one
+    query on the tickers table, the misses are searched concurrently (at most
+    `max_concurrency` at a time) and the new mappings are written back in one
+    transaction.
+    """
+    names = {
+        product: (product.lower(), normalize_product(product))
+        for product in dict.fromkeys(products)
+    }
+    tickers = {}
+    pending = []
+    for product, candidates in names.items():
+        cached = [_lru_get((db_path, name)) for name in candidates]
+        found = [ticker for ticker in cached if ticker]
+        if found:
+            tickers[product] = found[0]
+        elif cached[-1] == "":
+            # The search name is known not to exist, don't ask the database again
+            tickers[product] = ""
+        else:
+            pending.append(product)
 
-# Call the function to create tickers table
-create_ticker_table("portfolio_performance.db")
+    if pending:
+        known = await run_blocking(
+            _load_tickers, [name for p in pending for name in names[p]], db_path
+        )
+        for product in pending:
+            for name in names[product]:
+                if known.get(name):
+                    print(f"Found ticker {known[name]} for {product}")
+                    tickers[product] = known[name]
+                    _lru_put((db_path, name), known[name])
+                    break
+
+    misses = [product for product in pending if product not in tickers]
+    if misses:
+        # Results of earlier searches, read from the cache store in one go
+        searched = await run_blocking(
+            get_cache_store(db_path).get_many,
+            SYMBOLS,
+            [names[product][1] for product in misses],
+        )
+        semaphore = asyncio.Semaphore(max_concurrency)
+
+        async def search(product):
+            name = names[product][1]
+            if name in searched:
+                return searched[name]
+            async with semaphore:
+                return await _search_ticker_symbol(name, db_path)
+
+        found = await asyncio.gather(*(search(product) for product in misses))
+        new_tickers = {}
+        for product, ticker in zip(misses, found):
+            tickers[product] = ticker or ""
+            if ticker is not None:
+                # Failed requests (None) are retried on the next upload
+                _lru_put((db_path, names[product][1]), ticker)
+            if ticker:
+                new_tickers[names[product][1]] = ticker
+        if new_tickers:
+            await run_blocking(_store_tickers, new_tickers, db_path)
+        await run_blocking(get_cache_store(db_path).flush)
 
-if os.path.exists(TICKER_CACHE_FILE):
-    with open(TICKER_CACHE_FILE, "r") as f:
-        ticker_cache = json.load(f)
-else:
-    ticker_cache = {}
+    return tickers
 
-if os.path.exists(PRICE_CACHE_FILE):
-    with open(PRICE_CACHE_FILE, "r") as f:
-        price_cache = json.load(f)
-else:
-    price_cache = {}
 
-if os.path.exists(USD_TO_EUR_CACHE_FILE):
-    with open(USD_TO_EUR_CACHE_FILE, "r") as f:
-        usd_to_eur_cache = json.load(f)
-else:
-    usd_to_eur_cache = {}
+async def get_ticker_symbol(product, db_path=DB_PATH):
+    """
+    Resolves a single product name to its ticker symbol, or "" if unknown.
+    """
+    return (await resolve_tickers([product], db_path))[product]
 
 
-async def get_ticker_symbol(product, db_path="stocks.db"):
-    # Connect to the database
-    conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
+async def fetch_chart_price(ticker, currency="USD"):
+    """
+    Returns the latest market price of `ticker`, converted to EUR if requested,
+    or None if Yahoo does not answer.
+    """
+    data = await fetch_json(
+        f"{YAHOO_BASE_URL}/v8/finance/chart/{ticker}", {"interval": "1d"}
+    )
+    if not data:
+        print(f"Warning: Failed to fetch data for ticker {ticker}")
+        return None
 
-    # Check if the ticker exists in the database
-    cursor.execute("SELECT ticker FROM tickers WHERE product = ?", (product,))
-    result = cursor.fetchone()
-
-    if result:
-        ticker = result[0]
-        conn.close()
-        return ticker
-
-    url = f"https://query1.finance.yahoo.com/v1/finance/search?q={product}"
-    async with aiohttp.ClientSession() as session:
-        async with session.get(url) as response:
-            if response.status == 200:
-                data = await response.json()
-                quotes = data.get("quotes", [])
-                if quotes:
-                    ticker = quotes[0]["symbol"]
-                    if ticker:
-                        # Insert ticker into the database
-                        cursor.execute(
-                            """
-                            INSERT INTO tickers (product, ticker, date_added)
-                            VALUES (?, ?, ?)
-                        """,
-                            (
-                                product,
-                                ticker,
-                                datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                            ),
-                        )
-                        conn.commit()
-                    conn.close()
-                    return ticker
-    return ""
+    meta = data["chart"]["result"][0]["meta"]
+    current_price = meta["regularMarketPrice"]
+    # Convert price to EUR if needed
+    if currency == "EUR" and meta["currency"] != "EUR":
+        # A cache miss downloads the rate through yfinance, keep it off the loop
+        conversion_rate = await run_blocking(get_usd_to_eur_rate)
+        current_price /= conversion_rate
+    return current_price
 
 
 async def get_current_price(product, currency="USD"):
-    # Check if price is already in cache and if it's from today
-    today = datetime.now().strftime("%Y-%m-%d")
-    if product in price_cache and price_cache[product]["date"] == today:
-        return price_cache[product]["price"]
-
     # Get the current price using yfinance
-    product = (
-        product.lower()
-        .replace("adr on ", "")
-        .replace("class c", "")
-        .replace("class a", "")
-        .replace("class b", "")
-        .replace(".com", "")
-    )
-    ticker = await get_ticker_symbol(product.strip())
+    product = normalize_product(product)
+
+    # Check if price is already in cache, spot prices expire at midnight
+    cache = get_cache_store()
+    current_price = await run_blocking(cache.get, SPOT_PRICES, f"{product}|{currency}")
+    if current_price is not None:
+        return current_price
+
+    ticker = await get_ticker_symbol(product)
     if not ticker:
         print(f"Warning: Could not find ticker for {product}")
         return 0.0
 
-    async with aiohttp.ClientSession() as session:
-        url = f"https://query1.finance.yahoo.com/v8/finance/chart/{ticker}?interval=1d"
-        async with session.get(url) as response:
-            if response.status == 200:
-                data = await response.json()
-                current_price = data["chart"]["result"][0]["meta"]["regularMarketPrice"]
-                # Convert price to EUR if needed
-                if (
-                    currency == "EUR"
-                    and data["chart"]["result"][0]["meta"]["currency"] != "EUR"
-                ):
-                    conversion_rate = get_usd_to_eur_rate()
-                    current_price /= conversion_rate
-                # Store the result in cache
-                price_cache[product] = {"price": current_price, "date": today}
-                # Save cache to disk
-                with open(PRICE_CACHE_FILE, "w") as f:
-                    json.dump(price_cache, f)
-                return current_price
-            else:
-                print(f"Warning: Failed to fetch data for ticker {ticker}")
-                return 0.0
+    current_price = await fetch_chart_price(ticker, currency)
+    if current_price is None:
+        return 0.0
+
+    # Store the result in cache
+    cache.set(SPOT_PRICES, f"{product}|{currency}", current_price)
+    return current_price
 
 
 def get_usd_to_eur_rate():
-    today = datetime.now().strftime("%Y-%m-%d")
-    if "rate" in usd_to_eur_cache and usd_to_eur_cache["date"] == today:
-        return usd_to_eur_cache["rate"]
+    cache = get_cache_store()
+    current_rate = cache.get(FX, "EURUSD")
+    if current_rate is not None:
+        return current_rate
 
     # Get USD to EUR conversion rate using Yahoo Finance
     fx_ticker = yf.Ticker("EURUSD=X")
     current_rate = fx_ticker.history(period="1d")["Close"].iloc[-1]
     if pd.notna(current_rate):
-        usd_to_eur_cache["rate"] = current_rate
-        usd_to_eur_cache["date"] = today
-        with open(USD_TO_EUR_CACHE_FILE, "w") as f:
-            json.dump(usd_to_eur_cache, f)
+        cache.set(FX, "EURUSD", float(current_rate))
+        cache.flush()
         return current_rate
 
     print("Warning: Could not retrieve USD to EUR conversion rate")
@@ -161,72 +288,43 @@ def get_usd_to_eur_rate():
 
 
 async def get_current_prices(products, currency="USD"):
-    today = datetime.now().strftime("%Y-%m-%d")
-    prices = {}
+    cache = get_cache_store()
+    keys = {product: f"{normalize_product(product)}|{currency}" for product in products}
+    cached = await run_blocking(cache.get_many, SPOT_PRICES, list(keys.values()))
 
     # List of products that need fetching
-    products_to_fetch = [
-        product
-        for product in products
-        if product not in price_cache or price_cache[product]["date"] != today
-    ]
-
-    # Prepare tasks for products that need fetching
-    tasks = []
-    for product in products_to_fetch:
-        tasks.append(fetch_price_for_product(product, currency))
+    products_to_fetch = [product for product in products if keys[product] not in cached]
 
     # Run tasks concurrently
-    results = await asyncio.gather(*tasks)
+    results = await asyncio.gather(
+        *(fetch_price_for_product(product, currency) for product in products_to_fetch)
+    )
 
     # Update caches and prepare the final prices dictionary
+    prices = {
+        product: cached[keys[product]]
+        for product in products
+        if keys[product] in cached
+    }
     for product, price in results:
         if price is not None:
             prices[product] = price
-            price_cache[product] = {"price": price, "date": today}
-            # Optionally, save cache to disk here or batch later
-
-    # Include prices from the cache
-    for product in products:
-        if product in price_cache and price_cache[product]["date"] == today:
-            prices[product] = price_cache[product]["price"]
+            cache.set(SPOT_PRICES, keys[product], price)
 
+    # Write all new prices in one go
+    await run_blocking(cache.flush)
     return prices
 
 
 async def fetch_price_for_product(product, currency):
     # Fetch ticker symbol
-    ticker = await get_ticker_symbol(
-        product.lower()
-        .replace("adr on ", "")
-        .replace("class c", "")
-        .replace("class a", "")
-        .replace("class b", "")
-        .replace(".com", "")
-        .strip()
-    )
+    ticker = await get_ticker_symbol(normalize_product(product))
     if not ticker:
         print(f"Warning: Could not find ticker for {product}")
         return product, None
 
     # Fetch current price
-    async with aiohttp.ClientSession() as session:
-        url = f"https://query1.finance.yahoo.com/v8/finance/chart/{ticker}?interval=1d"
-        async with session.get(url) as response:
-            if response.status == 200:
-                data = await response.json()
-                current_price = data["chart"]["result"][0]["meta"]["regularMarketPrice"]
-                # Convert price to EUR if needed
-                if (
-                    currency == "EUR"
-                    and data["chart"]["result"][0]["meta"]["currency"] != "EUR"
-                ):
-                    conversion_rate = get_usd_to_eur_rate()
-                    current_price /= conversion_rate
-                return product, current_price
-            else:
-                print(f"Warning: Failed to fetch data for ticker {ticker}")
-                return product, None
+    return product, await fetch_chart_price(ticker, currency)
 
 
 async def get_historical_prices(ticker, start_date, end_date):
@@ -238,29 +336,20 @@ async def get_historical_prices(ticker, start_date, end_date):
     return historical_data
 
 
-def get_processed_tickers(products, db_name="stocks.db"):
-    conn = sqlite3.connect(db_name)
-    cursor = conn.cursor()
+def get_processed_tickers(products, db_name=DB_PATH):
+    products = list(products)
+    known = _load_tickers([product.lower() for product in products], db_name)
     tickers = {}
     for product in products:
-        cursor.execute(
-            "SELECT ticker FROM tickers WHERE product = ?", (product.lower(),)
-        )
-        result = cursor.fetchone()
-        if result:
-            print(f"Found ticker {result[0]} for {product}")
-            tickers[product] = result[0]
+        ticker = known.get(product.lower())
+        if ticker:
+            print(f"Found ticker {ticker} for {product}")
+            tickers[product] = ticker
+            _lru_put((db_name, product.lower()), ticker)
         else:
             tickers[product] = "NA"
-    conn.close()
     return tickers
 
 
-# TO BE IMPLEMENTED
 def save_caches():
-    with open(TICKER_CACHE_FILE, "w") as f:
-        json.dump(ticker_cache, f)
-    with open(PRICE_CACHE_FILE, "w") as f:
-        json.dump(price_cache, f)
-    with open(USD_TO_EUR_CACHE_FILE, "w") as f:
-        json.dump(usd_to_eur_cache, f)
+    flush_cache_stores()
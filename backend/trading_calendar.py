@@ -0,0 +1,110 @@
+from datetime import date, timedelta
+from functools import lru_cache
+
+import holidays
+import numpy as np
+from dateutil.easter import easter
+
+
+def _financial_holidays(market):
+    return lambda years: holidays.financial_holidays(market, years=years)
+
+
+def xetra_closures(years):
+    """
+    Returns the closing days of the Deutsche Börse cash market (Xetra) in
+    `years`. holidays only ships an XETR calendar in releases newer than the
+    one we depend on.
+    """
+    closures = []
+    for year in years:
+        good_friday = easter(year) - timedelta(days=2)
+        closures += [
+            date(year, 1, 1),
+            good_friday,
+            good_friday + timedelta(days=3),  # Easter Monday
+            date(year, 5, 1),
+            date(year, 12, 24),
+            date(year, 12, 25),
+            date(year, 12, 26),
+            date(year, 12, 31),
+        ]
+        if year <= 2021:
+            # Whit Monday and German Unity Day
+            closures += [good_friday + timedelta(days=52), date(year, 10, 3)]
+        if year == 2017:
+            closures.append(date(2017, 10, 31))  # Reformation Day
+    return closures
+
+
+# Closing days of the venues our holdings trade on, as functions of the years.
+# holidays has no Euronext calendar, its closures are those of the ECB TARGET
+# calendar.
+EXCHANGE_CLOSURES = {
+    "US": _financial_holidays("NYSE"),
+    "XETRA": xetra_closures,
+    "EURONEXT": _financial_holidays("ECB"),
+}
+DEFAULT_EXCHANGE = "US"
+
+# Yahoo ticker suffixes of the non-US venues
+TICKER_SUFFIX_EXCHANGES = {
+    ".DE": "XETRA",
+    ".F": "XETRA",
+    ".PA": "EURONEXT",
+    ".AS": "EURONEXT",
+    ".BR": "EURONEXT",
+    ".LS": "EURONEXT",
+    ".IR": "EURONEXT",
+}
+
+
+def exchange_for_ticker(ticker):
+    """
+    Returns the exchange of a Yahoo ticker symbol from its suffix.
+    """
+    _, _, suffix = ticker.rpartition(".")
+    return TICKER_SUFFIX_EXCHANGES.get(f".{suffix.upper()}", DEFAULT_EXCHANGE)
+
+
+@lru_cache(maxsize=None)
+def trading_days(exchange, first_year, last_year):
+    """
+    Returns the (read-only, cached) datetime64[D] array of the days `exchange`
+    is open from the start of `first_year` to the end of `last_year`.
+    """
+    years = range(first_year, last_year + 1)
+    try:
+        closures = EXCHANGE_CLOSURES[exchange](years)
+    except (KeyError, NotImplementedError) as e:
+        # Better an approximate calendar than a failed upload
+        print(f"Warning: no holiday calendar for {exchange} ({e!r}), using weekdays")
+        closures = []
+    days = np.arange(
+        np.datetime64(f"{first_year}-01-01"),
+        np.datetime64(f"{last_year + 1}-01-01"),
+        dtype="datetime64[D]",
+    )
+    days = days[
+        np.is_busday(days, holidays=np.array(sorted(closures), dtype="datetime64[D]"))
+    ]
+    days.flags.writeable = False
+    return days
+
+
+def is_trading_day(dates, exchanges=(DEFAULT_EXCHANGE,)):
+    """
+    Returns a mask of the `dates` (datetime64[D] array) on which at least one
+    of `exchanges` is open.
+    """
+    dates = np.asarray(dates, dtype="datetime64[D]")
+    open_days = np.zeros(len(dates), dtype=bool)
+    if not len(dates):
+        return open_days
+    years = [dates.min(), dates.max()]
+    first_year, last_year = np.array(years, dtype="datetime64[Y]").astype(int) + 1970
+    for exchange in sorted(set(exchanges)):
+        days = trading_days(exchange, int(first_year), int(last_year))
+        found = np.minimum(np.searchsorted(days, dates), len(days) - 1)
+        open_days |= days[found] == dates
+    return open_days
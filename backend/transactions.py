@@ -0,0 +1,94 @@
+import re
+
+import numpy as np
+import pandas as pd
+
+from amounts import parse_numbers
+
+# "Compra 2 Visa Inc@278,5 USD": the verb, the quantity and the price after "@"
+TRADE_PATTERN = re.compile(
+    r"^\s*(?P<verb>\S+)\s+(?P<quantity>[^\s@]+)[^@]*@\s*(?P<price>[^\s@]+)"
+)
+
+PARSED_COLUMNS = [
+    "product",
+    "description",
+    "side",
+    "quantity",
+    "price",
+    "currency",
+    "fx_rate",
+    "price_eur",
+    "date",
+    "error",
+]
+
+
+def parse_transactions(df):
+    """
+    Parses the buys and sells of an account export in one vectorized pass.
+
+    Returns one row per EUR/USD order row, in the order the positions are built
+    (oldest first), with typed columns product, description, side ("buy",
+    "sell" or None), quantity, price (in the trade currency), currency, fx_rate,
+    price_eur and date. Trades that cannot be parsed are kept with a message in
+    `error` instead of raising; see malformed_transactions.
+    """
+    df = df[~df["ID Orden"].isna()]
+    df = df[["Fecha", "Producto", "Descripción", "Tipo", "Variación", "Saldo"]]
+    df_eur = df[df["Variación"] == "EUR"]
+    df_usd = df[df["Variación"] == "USD"].copy()
+    df_usd["Tipo"] = parse_numbers(df_usd["Tipo"])[0].ffill()
+    df = pd.concat([df_eur, df_usd])[::-1]
+
+    description = df["Descripción"].astype("string")
+    is_buy = description.str.contains("Compra", regex=False).fillna(False)
+    is_sell = ~is_buy & description.str.contains("Venta", regex=False).fillna(False)
+    side = np.select(
+        [is_buy.to_numpy(bool), is_sell.to_numpy(bool)], ["buy", "sell"], None
+    )
+
+    # Only trades have to parse; fee and currency exchange rows are left as is
+    trade = (is_buy | is_sell).astype(bool)
+    parts = description[trade].str.extract(TRADE_PATTERN).reindex(df.index)
+    quantity = parse_numbers(parts["quantity"])[0]
+    price = parse_numbers(parts["price"])[0]
+    currency = df["Variación"]
+    fx_rate = parse_numbers(df["Tipo"])[0]
+    price_eur = price.where(currency != "USD", price / fx_rate)
+    date = pd.to_datetime(df["Fecha"], format="%d-%m-%Y", errors="coerce")
+
+    parsed = pd.DataFrame(
+        {
+            "product": df["Producto"],
+            "description": description,
+            "side": side,
+            "quantity": quantity.astype(float),
+            "price": price.astype(float),
+            "currency": currency,
+            "fx_rate": fx_rate.astype(float),
+            "price_eur": price_eur.astype(float),
+            "date": date,
+        },
+        index=df.index,
+    )
+
+    error = pd.Series(None, index=df.index, dtype=object)
+    checks = [
+        (parsed["date"].isna(), "unparseable date"),
+        ((currency == "USD") & parsed["fx_rate"].isna(), "missing FX rate"),
+        (parsed["price"].isna(), "unparseable price"),
+        (parsed["quantity"].isna(), "unparseable quantity"),
+    ]
+    for failed, message in checks:
+        error[trade & failed & error.isna()] = message
+    parsed["error"] = error
+    return parsed[PARSED_COLUMNS]
+
+
+def malformed_transactions(parsed):
+    """
+    Returns the trades of `parsed` that could not be parsed, with the reason in
+    the `error` column.
+    """
+    return parsed[parsed["error"].notna()]
@@ -0,0 +1,57 @@
+import os
+import asyncio
+import contextvars
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+# Number of threads used for blocking work (CSV parsing, SQLite, yfinance, pandas).
+# 0 runs the blocking work inline on the event loop.
+BLOCKING_WORKERS = int(os.environ.get("BLOCKING_WORKERS", "4"))
+
+_executor = None
+_inline = BLOCKING_WORKERS <= 0
+
+
+def get_executor():
+    """
+    Returns the executor used for blocking work, creating it on first use.
+    """
+    global _executor
+    if _executor is None and not _inline:
+        _executor = ThreadPoolExecutor(
+            max_workers=BLOCKING_WORKERS, thread_name_prefix="blocking"
+        )
+    return _executor
+
+
+def set_executor(executor):
+    """
+    Replaces the executor used for blocking work. None runs it inline.
+    """
+    global _executor, _inline
+    shutdown_executor()
+    _executor = executor
+    _inline = executor is None
+
+
+def shutdown_executor():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False)
+        _executor = None
+
+
+async def run_blocking(func, *args, **kwargs):
+    """
+    Runs a blocking function off the event loop and awaits its result. The
+    function runs in a copy of the caller's context, so request-scoped state
+    (see instrumentation.start_request) is visible in the worker thread.
+    """
+    executor = get_executor()
+    if executor is None:
+        return func(*args, **kwargs)
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(
+        executor, functools.partial(context.run, func, *args, **kwargs)
+    )